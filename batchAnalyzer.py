@@ -0,0 +1,358 @@
+import argparse
+import csv
+import math
+import multiprocessing
+import os
+import queue
+import time
+
+import numpy
+
+import botDetector
+import bufferPool
+import config as run_config
+import frameSources
+import ledExtractor
+
+# Number of frames sent to a worker process at a time
+DEFAULT_CHUNK_SIZE = 16
+
+# Number of frames between progress reports
+PROGRESS_INTERVAL = 100
+
+# Seconds to wait for a result before checking that the worker processes are still running
+RESULT_TIMEOUT = 1
+
+
+def probeRecording(recording_path):
+    """
+    Read the size and length of a recording, decoding only its first frame.
+    :param recording_path:  A session folder of .jpg images or a video file
+    :return:                A tuple of (width, height, frame_count)
+    """
+
+    source = frameSources.openRecording(recording_path)
+    frame = source.read()
+    frame_count = source.frameCount()
+    source.release()
+
+    if frame is None:
+        return 0, 0, 0
+
+    width, height = frame.full_size
+    return width, height, frame_count
+
+
+def produceFrames(recording_path, chunk_size, frame_queue, result_queue, workers):
+    """
+    Decode a recording and put its frames on a queue in chunks. Runs in its own process.
+    A None is put on the queue for each worker after the last chunk, even if decoding fails, in which case
+    the error is put on the result queue.
+    :param recording_path:  A session folder of .jpg images or a video file
+    :param chunk_size:      The number of frames in each chunk
+    :param frame_queue:     The queue to put the chunks of frames on
+    :param result_queue:    The queue to report a decoding error on
+    :param workers:         The number of worker processes taking chunks from the queue
+    """
+
+    try:
+        # Frames wait in chunks before being taken by the workers, so they can't share pooled buffers
+        source = frameSources.openRecording(recording_path)
+        start = None
+
+        chunk = []
+        for frame in source:
+            if start is None:
+                start = frame.timestamp
+
+            chunk.append((frame.index, frame.timestamp - start, frame.gray))
+
+            if len(chunk) >= chunk_size:
+                frame_queue.put(chunk)
+                chunk = []
+
+        if len(chunk) > 0:
+            frame_queue.put(chunk)
+
+        source.release()
+    except Exception as error:
+        result_queue.put(('error', 'Reading ' + recording_path + ' failed: ' + repr(error)))
+    finally:
+        for _ in range(workers):
+            frame_queue.put(None)
+
+
+def analyzeChunk(chunk, cam, bots, threshold, group_distance, led_spacing, buffers):
+    """
+    Locate the robots in each frame of a chunk. Frames are independent, so they need not be analyzed in order.
+    :param chunk:           A list of (frame index, timestamp, grayscale frame) tuples
+    :return:                A list of (frame index, timestamp, bot positions) tuples
+    """
+    results = []
+    for frame_idx, timestamp, gray_frame in chunk:
+        LEDs = ledExtractor.findLEDs(gray_frame, cam, threshold, buffers)
+        results.append((frame_idx, timestamp, botDetector.locateBots(LEDs, bots, group_distance, led_spacing)))
+
+    return results
+
+
+def analyzeFrames(frame_queue, result_queue, cam, bots, threshold, group_distance, led_spacing):
+    """
+    Take chunks of frames from the producer's queue until it signals the end of the recording, and put the
+    robot positions in them on the result queue. Runs in each worker process.
+    A ('done', rejection counts) message is always put last, after an ('error', message) if analysis failed.
+    """
+
+    buffers = bufferPool.BufferPool()
+    try:
+        while True:
+            chunk = frame_queue.get()
+            if chunk is None:
+                break
+            result_queue.put(('frames', analyzeChunk(chunk, cam, bots, threshold, group_distance, led_spacing,
+                                                     buffers)))
+    except Exception as error:
+        result_queue.put(('error', 'Analyzing frames failed: ' + repr(error)))
+    finally:
+        result_queue.put(('done', dict(botDetector.rejection_counts)))
+
+
+def analyzeRecording(recording_path, cam, bots, workers=None, chunk_size=DEFAULT_CHUNK_SIZE,
+                     threshold=ledExtractor.LED_THRESHOLD, group_distance=1, led_spacing=None, frame_count=0):
+    """
+    Extract the trajectory of each robot from a recording, using every core to locate the robots in its frames.
+    :param recording_path:  A session folder of .jpg images or a video file
+    :param cam:             The OverheadCamera that made the recording
+    :param bots:            The names of the patterns of the robots to locate
+    :param workers:         The number of worker processes to use, or None to use one per core
+    :param chunk_size:      The number of frames sent to a worker at a time
+    :param threshold:       The minimum brightness of a pixel to be considered part of an LED
+    :param group_distance:  The maximum distance between two LEDs to consider them part of the same robot
+    :param led_spacing:     The distance between adjacent LEDs of a robot, or None if it is not known
+    :param frame_count:     The number of frames in the recording, used only for progress reports
+    :return:                A list of (frame index, timestamp, bot positions) tuples in frame order
+    """
+
+    if workers is None:
+        workers = os.cpu_count() or 1
+
+    start = time.perf_counter()
+    botDetector.resetRejectionCounts()
+
+    # With a single worker, another process would only add the cost of sending it the frames
+    if workers < 2:
+        trajectory = analyzeSerially(recording_path, cam, bots, threshold, group_distance, led_spacing, frame_count)
+    else:
+        trajectory = analyzeInParallel(recording_path, cam, bots, workers, chunk_size, threshold, group_distance,
+                                       led_spacing, frame_count)
+
+    elapsed = time.perf_counter() - start
+    reportProgress(len(trajectory), frame_count, elapsed)
+
+    if len(trajectory) > 1 and elapsed > 0:
+        duration = trajectory[-1][1] - trajectory[0][1]
+        print('Processed {:.1f} s of recording in {:.1f} s ({:.1f}x real time)'.format(
+            duration, elapsed, duration / elapsed))
+
+    print('Shape checks: ' + ', '.join('{} {}'.format(stage, count)
+                                      for stage, count in botDetector.rejection_counts.items()))
+
+    return trajectory
+
+
+def analyzeSerially(recording_path, cam, bots, threshold, group_distance, led_spacing, frame_count):
+    """
+    Locate the robots in each frame of a recording in this process.
+    """
+    # Each frame is analyzed before the next is read, so capture and extraction can share pooled buffers
+    buffers = bufferPool.BufferPool()
+    source = frameSources.openRecording(recording_path, buffers=buffers)
+
+    trajectory = []
+    start = time.perf_counter()
+    first_timestamp = None
+
+    for frame in source:
+        if first_timestamp is None:
+            first_timestamp = frame.timestamp
+
+        trajectory += analyzeChunk([(frame.index, frame.timestamp - first_timestamp, frame.gray)], cam, bots,
+                                   threshold, group_distance, led_spacing, buffers)
+
+        if len(trajectory) % PROGRESS_INTERVAL == 0:
+            reportProgress(len(trajectory), frame_count, time.perf_counter() - start)
+
+    source.release()
+    return trajectory
+
+
+def analyzeInParallel(recording_path, cam, bots, workers, chunk_size, threshold, group_distance, led_spacing,
+                      frame_count):
+    """
+    Locate the robots in each frame of a recording, decoding it in one process and analyzing its frames in others.
+    """
+
+    # Bound the queue so the producer does not decode the whole recording into memory ahead of the workers
+    frame_queue = multiprocessing.Queue(maxsize=2 * workers)
+    result_queue = multiprocessing.Queue()
+
+    # Workers take frames straight from the producer, so each frame is sent between processes only once
+    processes = [multiprocessing.Process(target=produceFrames,
+                                         args=(recording_path, chunk_size, frame_queue, result_queue, workers),
+                                         daemon=True)]
+    for _ in range(workers):
+        processes.append(multiprocessing.Process(target=analyzeFrames, args=(frame_queue, result_queue, cam, bots,
+                                                                             threshold, group_distance, led_spacing),
+                                                 daemon=True))
+    for process in processes:
+        process.start()
+
+    trajectory = []
+    errors = []
+    start = time.perf_counter()
+    next_report = PROGRESS_INTERVAL
+
+    workers_done = 0
+    while workers_done < workers:
+        try:
+            kind, payload = result_queue.get(timeout=RESULT_TIMEOUT)
+        except queue.Empty:
+            # A process that was killed can't send its end marker, so stop waiting once none are left
+            if not any(process.is_alive() for process in processes):
+                errors.append('Worker processes exited without finishing')
+                break
+            continue
+
+        if kind == 'frames':
+            trajectory += payload
+            if len(trajectory) >= next_report:
+                next_report += PROGRESS_INTERVAL
+                reportProgress(len(trajectory), frame_count, time.perf_counter() - start)
+        elif kind == 'error':
+            errors.append(payload)
+        else:
+            workers_done += 1
+            for stage, count in payload.items():
+                botDetector.rejection_counts[stage] += count
+
+    for process in processes:
+        process.join()
+
+    if len(errors) > 0:
+        raise RuntimeError('\n'.join(errors))
+
+    # Chunks finish out of order across workers
+    trajectory.sort(key=lambda row: row[0])
+    return trajectory
+
+
+def reportProgress(frames_done, frame_count, elapsed):
+    fps = frames_done / elapsed if elapsed > 0 else 0
+
+    if frame_count > 0:
+        print('Frame {}/{} ({:.0%}), {:.1f} frames per second'.format(
+            frames_done, frame_count, frames_done / frame_count, fps))
+    else:
+        print('Frame {}, {:.1f} frames per second'.format(frames_done, fps))
+
+
+def writeTrajectoryCSV(path, trajectory, bots):
+    """
+    Write a per-frame trajectory table as CSV, with an x and y column for each robot.
+    Robots that were not found in a frame are left empty.
+    """
+    with open(path, 'w', newline='') as csv_file:
+        writer = csv.writer(csv_file)
+
+        header = ['frame', 'time']
+        for bot in bots:
+            header += [bot + '_x', bot + '_y']
+        writer.writerow(header)
+
+        for frame_idx, timestamp, bot_positions in trajectory:
+            row = [frame_idx, '{:.6f}'.format(timestamp)]
+            for bot in bots:
+                position = bot_positions.get(bot)
+                if position is None:
+                    row += ['', '']
+                else:
+                    row += ['{:.4f}'.format(position[0]), '{:.4f}'.format(position[1])]
+            writer.writerow(row)
+
+
+def writeTrajectoryNPZ(path, trajectory, bots):
+    """
+    Write a per-frame trajectory table as a NumPy .npz archive.
+    The archive holds 'frame' and 'time' arrays and an (N, 2) array of positions for each robot.
+    Robots that were not found in a frame are NaN.
+    """
+    arrays = {
+        'frame': numpy.array([frame_idx for frame_idx, _, _ in trajectory], dtype=numpy.int64),
+        'time': numpy.array([timestamp for _, timestamp, _ in trajectory], dtype=numpy.float64)
+    }
+
+    for bot in bots:
+        positions = numpy.full((len(trajectory), 2), math.nan)
+        for row_idx, (_, _, bot_positions) in enumerate(trajectory):
+            position = bot_positions.get(bot)
+            if position is not None:
+                positions[row_idx] = position
+        arrays[bot] = positions
+
+    numpy.savez(path, **arrays)
+
+
+def parseArgs():
+    parser = argparse.ArgumentParser(description='Extract robot trajectories from a recorded session.')
+    parser.add_argument('recording', help='session folder of .jpg images or a video file made by makeVideo')
+    parser.add_argument('-o', '--output', help='trajectory table to write, .csv or .npz (default: <recording>.csv)')
+    parser.add_argument('-w', '--workers', type=int, default=None, help='worker processes (default: one per core)')
+    parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE, help='frames per worker task')
+    parser.add_argument('-c', '--config', help='JSON file of config values used for the recording')
+    parser.add_argument('--threshold', type=int, default=None, help='LED brightness threshold')
+    parser.add_argument('--fov', type=float, nargs=2, default=(None, None),
+                        metavar=('WIDTH', 'HEIGHT'), help='camera field of view in degrees')
+    parser.add_argument('--bots', nargs='+', default=None, help='patterns of the robots to locate')
+    return parser.parse_args()
+
+
+def main():
+    args = parseArgs()
+
+    width, height, frame_count = probeRecording(args.recording)
+    if frame_count < 1:
+        print('No frames found in ' + args.recording)
+        return
+
+    overrides = {
+        'threshold': args.threshold,
+        'cam_fov_width': args.fov[0],
+        'cam_fov_height': args.fov[1],
+        'bots_in_play': args.bots
+    }
+
+    # Without a config file, assume the recording was made by the Raspberry Pi camera
+    if args.config is None:
+        overrides['is_rpi'] = True
+
+    config = run_config.loadConfig(args.config, overrides)
+    cam = run_config.makeOverheadCamera(config, image_size=(width, height))
+    bots = config['bots_in_play']
+
+    output = args.output
+    if output is None:
+        output = os.path.splitext(os.path.normpath(args.recording))[0] + '.csv'
+
+    trajectory = analyzeRecording(args.recording, cam, bots, args.workers, args.chunk_size, config['threshold'],
+                                  config['group_distance'], config['led_spacing'], frame_count)
+
+    if output.endswith('.npz'):
+        writeTrajectoryNPZ(output, trajectory, bots)
+    else:
+        writeTrajectoryCSV(output, trajectory, bots)
+
+    print('Wrote trajectories of {} frames to {}'.format(len(trajectory), output))
+
+
+if __name__ == '__main__':
+    main()
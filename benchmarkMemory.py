@@ -0,0 +1,110 @@
+import argparse
+import time
+import tracemalloc
+
+import bufferPool
+import config as run_config
+import frameSources
+import ledExtractor
+
+# Frames to process before measuring, while pooled buffers are still being sized
+WARMUP_FRAMES = 5
+
+
+def measureFrames(config, frames, pooled, video_path=None):
+    """
+    Capture and extract the LEDs of frames, measuring the memory allocated while processing each frame.
+    NumPy reports its allocations to tracemalloc, including the arrays OpenCV allocates for its outputs.
+    :param config:          The config dict, whose camera size sets the size of synthetic frames
+    :param frames:          The number of frames to measure
+    :param pooled:          If True, capture and process the frames through a BufferPool
+    :param video_path:      A video file to decode and convert to grayscale as a webcam's frames are,
+                            or None to measure synthetic frames, which are drawn in grayscale
+    :return:                A tuple of the mean and largest peak allocation per frame in bytes,
+                            the mean time per frame in seconds, and the BufferPool or None
+    """
+
+    buffers = None
+    if pooled:
+        buffers = bufferPool.BufferPool()
+
+    if video_path is None:
+        source = frameSources.SyntheticSource(config['cam_width'], config['cam_height'], config['bots_in_play'],
+                                              buffers=buffers)
+    else:
+        source = frameSources.VideoFileSource(video_path, buffers=buffers)
+
+    # The frame size, and so the camera and buffer sizes, are only known once the first frame is read
+    cam = None
+
+    peaks = []
+    start = None
+
+    tracemalloc.start()
+    for frame_idx in range(WARMUP_FRAMES + frames):
+        if frame_idx == WARMUP_FRAMES:
+            start = time.perf_counter()
+
+        baseline, _ = tracemalloc.get_traced_memory()
+        tracemalloc.reset_peak()
+
+        frame = source.read()
+        if frame is None:
+            break
+
+        if cam is None:
+            cam = run_config.makeOverheadCamera(config, image_size=frame.full_size)
+            if buffers is not None:
+                buffers.preallocate(frame.gray.shape[1], frame.gray.shape[0])
+
+        ledExtractor.findLEDs(frame.gray, cam, config['threshold'], buffers)
+        del frame
+
+        _, peak = tracemalloc.get_traced_memory()
+        if frame_idx >= WARMUP_FRAMES:
+            peaks.append(peak - baseline)
+
+    elapsed = time.perf_counter() - start if start is not None else 0
+    tracemalloc.stop()
+    source.release()
+
+    if len(peaks) < 1:
+        raise ValueError('Not enough frames to measure, {} are needed to warm up'.format(WARMUP_FRAMES + 1))
+
+    return sum(peaks) / len(peaks), max(peaks), elapsed / len(peaks), buffers
+
+
+def parseArgs():
+    parser = argparse.ArgumentParser(description='Measure the memory allocated per frame with and without the '
+                                                 'buffer pool.')
+    parser.add_argument('-c', '--config', help='JSON file of config values')
+    parser.add_argument('--rpi', dest='is_rpi', action=argparse.BooleanOptionalAction, default=True,
+                        help='use the Raspberry Pi camera size (default) or the webcam size')
+    parser.add_argument('-n', '--frames', type=int, default=50, help='number of frames to measure')
+    parser.add_argument('--video', help='video file to measure, decoded and converted as webcam frames are '
+                                        '(default: synthetic grayscale frames of the camera size)')
+    return parser.parse_args()
+
+
+def main():
+    args = parseArgs()
+    config = run_config.loadConfig(args.config, {'is_rpi': args.is_rpi})
+
+    if args.video is None:
+        print('Synthetic frames of {}x{}, {} frames'.format(config['cam_width'], config['cam_height'], args.frames))
+    else:
+        print('Video {}, {} frames'.format(args.video, args.frames))
+
+    for pooled in (False, True):
+        mean_peak, max_peak, frame_time, buffers = measureFrames(config, args.frames, pooled, args.video)
+
+        print('{}: {:.2f} MB allocated per frame on average, {:.2f} MB at most, {:.1f} ms per frame'.format(
+            'Buffer pool' if pooled else 'No buffer pool', mean_peak / 1e6, max_peak / 1e6, frame_time * 1000))
+
+        if buffers is not None:
+            print('  {} buffers allocated in total, holding {:.2f} MB'.format(buffers.allocations,
+                                                                              buffers.nbytes() / 1e6))
+
+
+if __name__ == '__main__':
+    main()
@@ -150,6 +150,69 @@ def groupCenters(groups):
     return group_points
 
 
+def locateBots(LEDs, bot_names, threshold_distance=1, led_spacing=None):
+    """
+    Find the position of each named robot among a set of LED positions.
+    :param LEDs:                    A list of LED positions as (x, y) tuples
+    :param bot_names:               The names of the patterns of the robots to locate
+    :param threshold_distance:      The maximum distance between two LEDs to consider them part of the same robot
+    :param led_spacing:             The distance between adjacent LEDs of a robot, or None if it is not known
+    :return:                        A dict of the center point of each robot, or None if it was not found
+    """
+
+    return matchGroups(groupNearbyPoints(LEDs, threshold_distance), bot_names, led_spacing)
+
+
+def matchGroups(groups, bot_names, led_spacing=None):
+    """
+    Find the group of LEDs that best matches each named robot's pattern.
+    :param groups:                  A list of groups of LED positions, as made by groupNearbyPoints
+    :param bot_names:               The names of the patterns of the robots to locate
+    :param led_spacing:             The distance between adjacent LEDs of a robot, or None if it is not known
+    :return:                        A dict of the center point of each robot, or None if it was not found
+    """
+
+    bot_positions = {}
+    for bot_pattern, (best_bot, _) in bestMatches(groups, bot_names, led_spacing).items():
+        bot_positions[bot_pattern] = groupCenter(best_bot)
+
+    return bot_positions
+
+
+def bestMatches(groups, bot_names, led_spacing=None):
+    """
+    Find the group of LEDs that best matches each named robot's pattern, along with its matching score.
+    :param groups:                  A list of groups of LED positions, as made by groupNearbyPoints
+    :param bot_names:               The names of the patterns of the robots to locate
+    :param led_spacing:             The distance between adjacent LEDs of a robot, or None if it is not known
+    :return:                        A dict of the (group, score) of each robot, or (None, inf) if it was not found
+    """
+
+    # Each group is measured for the checks at most once, however many patterns it is checked against
+    measurements = [{} for _ in groups]
+
+    matches = {}
+    for bot_pattern in bot_names:
+        best_score = math.inf
+        best_bot = None
+
+        pattern = botPatterns.getPattern(bot_pattern)
+
+        for group_idx, group in enumerate(groups):
+
+            if len(group) < 1:
+                continue
+
+            score = detectShape(group, pattern, led_spacing, measurements[group_idx])
+            if score < best_score:
+                best_bot = group
+                best_score = score
+
+        matches[bot_pattern] = (best_bot, best_score)
+
+    return matches
+
+
 def numPointsInPattern(pattern):
     """
     Return the number of points in a pattern.
@@ -183,27 +246,190 @@ def cartesianToPolar(cart_vector):
     return r, theta
 
 
+# Cheap checks run before the full match, in order from cheapest to most expensive.
+# A group is rejected as soon as one of them shows it can't be the pattern.
+
+# Largest number of LEDs a group may have, as a multiple of the pattern's, allowing every LED to be found twice
+MAX_LED_COUNT_FACTOR = 2
+
+# Factor by which the size of a group, measured as the largest distance between two of its points,
+# may differ from the size of the pattern
+SIZE_TOLERANCE = 1.3
+
+# Distance in LED spacings by which the LED closest to the center of a group may be further from the center than
+# in a pattern with a center LED, or closer to it than in a pattern without one.
+# This allows for centroid truncation and an LED counted twice, since the full match tolerates both.
+CENTER_DISTANCE_TOLERANCE = 0.6
+
+# Number of group and pattern pairs that each check has rejected, and the number that went on to the full match
+rejection_counts = {
+    'count': 0,
+    'size': 0,
+    'center': 0,
+    'matched': 0
+}
+
+
+def resetRejectionCounts():
+    for stage in rejection_counts:
+        rejection_counts[stage] = 0
+
+
+# Measurements of each pattern used by the checks, computed once per pattern
+pattern_profiles = {}
+
+
+def patternProfile(pattern):
+    """
+    Measure a pattern in units of the LED spacing for the checks that run before the full match.
+    :param pattern:         A 3x3 2D list of bits representing the presence of a point at that location
+    :return:                A dict of the pattern's LED count, center LED state, diameter,
+                            and distance from its center of mass to its closest LED
+    """
+
+    key = tuple(tuple(row) for row in pattern)
+    if key in pattern_profiles:
+        return pattern_profiles[key]
+
+    # Lay the pattern out as points one unit apart, with the center of the pattern at the origin
+    points = []
+    for row_idx in range(len(pattern)):
+        for col_idx in range(len(pattern[row_idx])):
+            if pattern[row_idx][col_idx] > 0:
+                points.append((col_idx - 1, 1 - row_idx))
+
+    has_center = pattern[1][1] > 0
+
+    profile = {
+        'size': len(points),
+        'has_center': has_center,
+        'diameter': groupDiameter(points),
+        'center_distance': centerDistance(points)
+    }
+
+    pattern_profiles[key] = profile
+    return profile
+
+
+def groupDiameter(points):
+    """
+    Get the largest distance between any two points in a group.
+    Unlike the diagonal of an axis-aligned bounding box, it does not change as the group rotates.
+    :param points:          The group of points
+    :return:                The largest distance
+    """
+    max_distance = 0
+    for point_idx in range(len(points)):
+        for other_point in points[point_idx + 1:]:
+            max_distance = max(max_distance, distance(points[point_idx], other_point))
+
+    return max_distance
+
+
+def closestPointIndex(points, ref_point):
+    """
+    Get the index of the point closest to a reference point.
+    """
+    min_distance = math.inf
+    closest_idx = -1
+    for point_idx in range(len(points)):
+        point_distance = distance(ref_point, points[point_idx])
+        if point_distance < min_distance:
+            min_distance = point_distance
+            closest_idx = point_idx
+
+    return closest_idx
+
+
+def centerDistance(points):
+    """
+    Get the distance from the center of mass of a group of points to the point closest to it.
+    """
+    center = groupCenter(points)
+    return distance(center, points[closestPointIndex(points, center)])
+
+
+def measureGroup(group, measurements):
+    """
+    Measure a group for the checks that need more than its LED count, unless it has already been measured.
+    A group is checked against every pattern in play, so bestMatches measures it only once.
+    :param group:           The group of points to measure
+    :param measurements:    A dict to store the measurements in, empty if the group has not been measured yet
+    :return:                The dict of the group's diameter and distance from its center of mass to its closest LED
+    """
+    if len(measurements) < 1:
+        measurements['diameter'] = groupDiameter(group)
+        measurements['center_distance'] = centerDistance(group)
+
+    return measurements
+
+
+def rejectShape(group, profile, led_spacing=None, measurements=None):
+    """
+    Run the cheap checks that can rule out a group as a match to a pattern before the full match is attempted.
+    :param group:           The group of points to check
+    :param profile:         The patternProfile of the pattern to check against
+    :param led_spacing:     The distance between adjacent LEDs of a robot, or None to skip the size check
+    :param measurements:    A dict of the group's measurements shared between the patterns it is checked against,
+                            or None to measure it for this check only
+    :return:                The name of the check that rejected the group, or None if it passed all of them
+    """
+
+    # The full match needs a spoke in the group for every spoke in the pattern. It ignores extra LEDs, such as an
+    # LED whose inner and outer contours were both kept, but no more than one per LED of the pattern.
+    if len(group) < profile['size'] or len(group) > profile['size'] * MAX_LED_COUNT_FACTOR:
+        return 'count'
+
+    measurements = measureGroup(group, {} if measurements is None else measurements)
+    diameter = measurements['diameter']
+
+    # The group must be about the size of the pattern.
+    # This check needs the LED spacing of the robots' boards in feet, which is only known once it has been measured
+    # for the robots in use, so it is skipped until led_spacing is configured.
+    if led_spacing is not None:
+        expected_diameter = profile['diameter'] * led_spacing
+        if diameter > expected_diameter * SIZE_TOLERANCE or diameter < expected_diameter / SIZE_TOLERANCE:
+            return 'size'
+
+    # The group must have an LED near its center if the pattern does, and none there if it doesn't.
+    # The distance is measured in LED spacings, taking the group's LED spacing from its size rather than from
+    # its closest LEDs, which noise and doubled LEDs bring closer together.
+    if diameter <= 0:
+        return 'center'
+    center_distance = measurements['center_distance'] * profile['diameter'] / diameter
+    if profile['has_center']:
+        if center_distance > profile['center_distance'] + CENTER_DISTANCE_TOLERANCE:
+            return 'center'
+    elif center_distance < profile['center_distance'] - CENTER_DISTANCE_TOLERANCE:
+        return 'center'
+
+    return None
+
+
 # The idea is to treat the LED board like a wheel.
 # There is a center point and 8 spokes.
 # Find the center point if it exists and the angles between each spoke.
-def detectShape(group, pattern):
+def detectShape(group, pattern, led_spacing=None, measurements=None):
     """
     Evaluate how similar a group of given points is to a specified pattern of points.
     A lower score returned indicates a higher similarity.
     :param group:           The group of points to match to a pattern
     :param pattern:         The pattern (2D list of binary numbers) to match the points to
+    :param led_spacing:     The distance between adjacent LEDs of a robot, or None if it is not known
+    :param measurements:    A dict of the group's measurements shared between the patterns it is matched to, or None
     :return:                A score indicating the similarity between the group and pattern
     """
 
-    pattern_size = numPointsInPattern(pattern)
-
-    # The group won't match the pattern if it doesn't contain as many LEDs as the pattern
-    # Return the worst possible score
-    if len(group) < pattern_size:
+    # Return the worst possible score for groups that the cheap checks show can't match the pattern
+    rejected_by = rejectShape(group, patternProfile(pattern), led_spacing, measurements)
+    if rejected_by is not None:
+        rejection_counts[rejected_by] += 1
         return math.inf
 
+    rejection_counts['matched'] += 1
+
     # Get the center of the group
-    group_center = groupCenters([group])[0]
+    group_center = groupCenter(group)
 
     remaining_points = group.copy()
 
@@ -212,19 +438,7 @@ def detectShape(group, pattern):
     center_point = group_center
     center_state = pattern[1][1]
     if center_state > 0:
-
-        # Get the center point of the group
-        min_distance = math.inf
-        center_point_idx = -1
-        for point_idx in range(len(group)):
-            point = group[point_idx]
-
-            point_distance = distance(group_center, point)
-            if point_distance < min_distance:
-                min_distance = point_distance
-                center_point_idx = point_idx
-
-        center_point = remaining_points.pop(center_point_idx)
+        center_point = remaining_points.pop(closestPointIndex(group, group_center))
 
     # Convert all the remaining points to polar coordinates
     # with the center point as the origin of the polar coordinate frame
@@ -233,9 +447,6 @@ def detectShape(group, pattern):
     # Get the length of the shortest spoke in the wheel
     side_spoke_length = min([spoke[0] for spoke in spoke_points])
 
-    pattern_spokes = pattern.copy()
-    pattern_spokes[1][1] = 0
-
     expected_spokes = convertPatternToPoints(pattern, side_spoke_length)
 
     match_score = matchWheels(expected_spokes, spoke_points)
@@ -326,7 +537,7 @@ def convertPatternToPoints(pattern, distance):
     """
 
     # Make a copy of the pattern with the center point empty to represent only the outside points of the pattern
-    pattern_points = pattern.copy()
+    pattern_points = [row.copy() for row in pattern]
     pattern_points[1][1] = 0
 
     expectedPoints = []
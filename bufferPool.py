@@ -0,0 +1,66 @@
+import numpy
+
+
+class BufferPool:
+    """
+    Named image buffers that are allocated once and reused for every frame, so that image processing stages can
+    write their output into them through OpenCV dst= arguments instead of allocating new full-size arrays.
+    A buffer is only reallocated if it is asked for with a different shape or type, such as when a camera
+    delivers frames of a different size than it was configured for.
+    """
+
+    def __init__(self):
+        self.buffers = {}
+
+        # Number of buffers allocated, which stops growing once every buffer has been sized
+        self.allocations = 0
+
+    def buffer(self, name, shape, dtype=numpy.uint8):
+        """
+        Get a buffer, allocating it only if it doesn't exist yet with the given shape and type.
+        :param name:            The name of the buffer
+        :param shape:           The shape of the buffer, as (height, width) or (height, width, channels)
+        :param dtype:           The element type of the buffer
+        :return:                The buffer, whose contents are left over from its last use
+        """
+        array = self.buffers.get(name)
+        if array is None or array.shape != tuple(shape) or array.dtype != dtype:
+            array = numpy.empty(shape, dtype=dtype)
+            self.buffers[name] = array
+            self.allocations += 1
+
+        return array
+
+    def sizedBuffer(self, name, shape, dtype=numpy.uint8):
+        """
+        Get a buffer that is kept separately for each shape, for stages that run at more than one resolution,
+        such as LED extraction while the frame scheduler downscales frames. Asking for one shape does not
+        reallocate the buffer of another, so switching between resolutions allocates nothing once both are sized.
+        """
+        return self.buffer(name + '_' + 'x'.join(str(length) for length in shape), shape, dtype)
+
+    def get(self, name):
+        """
+        Get a buffer if it exists, for functions that size their own output, such as cv2.VideoCapture.read().
+        :return:                The buffer, or None if it doesn't exist yet
+        """
+        return self.buffers.get(name)
+
+    def keep(self, name, array):
+        """
+        Keep an array that a function allocated in place of the buffer, so that it is reused next time.
+        """
+        if self.buffers.get(name) is not array:
+            self.buffers[name] = array
+            self.allocations += 1
+
+    def preallocate(self, width, height):
+        """
+        Allocate the buffers that LED extraction uses for every frame, for detection frames of the given size.
+        Capture buffers are sized by the frame source on its first frame, since not every source needs them.
+        """
+        self.sizedBuffer('binary', (height, width))
+        self.sizedBuffer('edges', (height, width))
+
+    def nbytes(self):
+        return sum(array.nbytes for array in self.buffers.values())
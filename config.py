@@ -0,0 +1,138 @@
+import copy
+import json
+
+from OverheadCamera import OverheadCamera
+
+# Camera settings for the Raspberry Pi camera (Arducam B0449)
+PI_CAMERA = {
+    'cam_width': 4656,  # Width of the camera frame in pixels
+    'cam_height': 3496,  # Height of the camera frame in pixels
+    'cam_fov_width': 110,  # Width of the camera frame in degrees, also called horizontal field of view
+    'cam_fov_height': 95,  # Height of the camera frame in degrees, also called vertical field of view
+    'exposure_factor': 1 / 12  # Factor applied to the automatic exposure time, 1/12 seems to work
+}
+
+# Typical settings for a widescreen laptop webcam
+WEBCAM = {
+    'cam_width': 1280,
+    'cam_height': 720,
+    'cam_fov_width': 65,
+    'cam_fov_height': 37,
+    'exposure_factor': 0  # Exposure value passed to the webcam, -8 seems to work for testing
+}
+
+DEFAULT_CONFIG = {
+    # Run parameters
+    'run_server': True,  # Will run a server and wait for a client connection if True
+    'is_rpi': False,  # Set to True for the Raspberry Pi, False to test on a Windows computer
+    'display': True,  # Will only open a window to view the camera frames if this is True
+    'save_frame_rate': 0,  # Frame rate to save captured images for later viewing. Will not save if 0 or negative.
+    'has_compass': False,  # If True, will use a magnetometer to find the compass heading of the field's major axis
+    'run_detection': True,  # If True, will execute the robot detection algorithm
+
+    # Server parameters
+    'port': 5000,
+    'packet_size': 4096,  # Largest packet a client must receive, sent to clients in the config packet
+
+    # Detection parameters
+    'threshold': 230,  # Grayscale brightness above which a pixel is considered part of an LED
+    'group_distance': 1,  # Maximum distance in feet between two LEDs of the same robot
+    'led_spacing': None,  # Distance in feet between adjacent LEDs of a robot, used to reject groups of the wrong size
+    'bots_in_play': ['X', 'Y', 'STAIR', 'H', 'L'],
+
+    # Adaptive threshold, which keeps the number of LED candidates in each frame within a band around the number of
+    # LEDs of the robots in play by adjusting the threshold, and the exposure once the threshold reaches its limits.
+    # The exposure is never raised above the one set by exposure_factor.
+    'adaptive_threshold': False,
+    'min_threshold': 150,
+    'max_threshold': 254,
+    'candidate_band': [0.8, 2.0],  # Band of candidate counts to aim for, as multiples of the expected LED count
+
+    # Frame deadline, which when set steps down through degradation levels (see frameScheduler) whenever the time
+    # from capture to publication of frames is at risk of passing it, and back up when there is headroom again
+    'frame_deadline_ms': None,
+    'max_groups': 10,  # Largest number of groups of LEDs scored per frame at the limit_groups level
+    'confident_score': 5,  # Highest matching score at which a robot is tracked without matching at track_confident
+    'track_distance': 1,  # Furthest in feet a tracked robot may move between frames
+
+    # Frame source: 'picamera', 'webcam', 'video', 'folder', 'synthetic',
+    # or 'auto' to use the picamera on the Raspberry Pi and the webcam otherwise
+    'source': 'auto',
+    'source_path': None,  # The video file or image folder read by the 'video' and 'folder' sources
+
+    # Size of the low resolution frames used for detection, or None to detect on the full resolution frames
+    'detection_width': None,
+    'detection_height': None,
+
+    # Camera parameters, which default to PI_CAMERA or WEBCAM depending on is_rpi when left as None
+    'cam_width': None,
+    'cam_height': None,
+    'cam_fov_width': None,
+    'cam_fov_height': None,
+    'exposure_factor': None,
+
+    # Camera placement, measured in feet so the output of the algorithm is also in feet
+    'cam_phi': 90,
+    'midfield_offset': 0,
+    'sideline_offset': 0,
+    'cam_elevation': 19 + 8 / 12,
+    'bot_height': 1 + 10 / 12
+}
+
+
+def loadConfig(path=None, overrides=None):
+    """
+    Build the run configuration from the defaults, an optional JSON config file, and any overrides.
+    Later sources take precedence over earlier ones.
+    :param path:            The path of a JSON file of config values, or None to use only the defaults
+    :param overrides:       A dict of config values that take precedence over the file, such as CLI options
+    :return:                The config dict
+    """
+
+    config = copy.deepcopy(DEFAULT_CONFIG)
+
+    sources = []
+    if path is not None:
+        with open(path) as config_file:
+            sources.append(json.load(config_file))
+    if overrides is not None:
+        sources.append(overrides)
+
+    for source in sources:
+        for key, value in source.items():
+            if key not in DEFAULT_CONFIG:
+                raise ValueError('Unknown config key: ' + key)
+
+            # Leave defaults in place for options that were not given
+            if value is not None:
+                config[key] = value
+
+    # Fill any camera parameters that were not given from the camera preset
+    preset = PI_CAMERA if config['is_rpi'] else WEBCAM
+    for key, value in preset.items():
+        if config[key] is None:
+            config[key] = value
+
+    return config
+
+
+def makeOverheadCamera(config, image_size=None):
+    """
+    Define the overhead camera object that performs coordinate transformations.
+    :param config:          The config dict
+    :param image_size:      The (width, height) of the frames in pixels, or None to use the configured camera size
+    :return:                The OverheadCamera
+    """
+
+    if image_size is None:
+        image_size = (config['cam_width'], config['cam_height'])
+
+    return OverheadCamera(
+        field_of_view=(config['cam_fov_width'], config['cam_fov_height']),
+        phi=config['cam_phi'],
+        image_size=image_size,
+        midfield_offset=config['midfield_offset'],
+        sideline_offset=config['sideline_offset'],
+        height=config['cam_elevation'],
+        bot_height=config['bot_height']
+    )
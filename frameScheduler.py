@@ -0,0 +1,207 @@
+import time
+
+import botDetector
+import botPatterns
+
+# Degradation levels, in the order they are stepped through. Each level also applies all the levels before it.
+FULL_QUALITY = 0
+DOWNSCALE = 1  # Detect LEDs on a frame downscaled by DOWNSCALE_FACTOR
+TRACK_CONFIDENT = 2  # Skip matching for robots that were confidently tracked last frame
+LIMIT_GROUPS = 3  # Score at most max_groups groups per frame
+SKIP_FRAMES = 4  # Process only one of every SKIP_INTERVAL frames
+
+LEVEL_NAMES = ('full_quality', 'downscale', 'track_confident', 'limit_groups', 'skip_frames')
+
+DOWNSCALE_FACTOR = 2
+SKIP_INTERVAL = 2
+
+
+class FrameScheduler:
+    """
+    Keep the time from capture to publication of each frame within a deadline by stepping down through
+    degradation levels when the deadline is at risk, and back up when there is headroom again.
+    """
+
+    # Weight of the newest frame in the moving average of frame times
+    SMOOTHING = 0.3
+
+    def __init__(self, deadline, degrade_at=0.9, restore_at=0.6, restore_frames=30, settle_frames=3):
+        """
+        :param deadline:        The time allowed from capture to publication of a frame in seconds
+        :param degrade_at:      Step down a level when the average frame time passes this fraction of the deadline
+        :param restore_at:      Step up a level when the average frame time stays below this fraction of the deadline
+        :param restore_frames:  The number of frames in a row that must be below restore_at to step up a level
+        :param settle_frames:   The number of frames to wait after changing level before judging its effect
+        """
+        self.deadline = deadline
+        self.degrade_at = degrade_at
+        self.restore_at = restore_at
+        self.restore_frames = restore_frames
+        self.settle_frames = settle_frames
+
+        self.level = FULL_QUALITY
+        self.average_time = 0
+        self.stage_times = {}
+        self.frames_with_headroom = 0
+        self.frames_since_change = 0
+        self.missed_deadlines = 0
+        self.skipped_frames = 0
+
+    def shouldProcess(self, frame):
+        """
+        Decide whether to process a frame or drop it to catch up.
+        :param frame:           The Frame that was just captured
+        :return:                True if the frame should be processed
+        """
+        if self.level >= SKIP_FRAMES and frame.index % SKIP_INTERVAL != 0:
+            self.skipped_frames += 1
+            return False
+        return True
+
+    def endFrame(self, trace):
+        """
+        Record the timing of a processed frame and change the level if needed.
+        :param trace:           The FrameTrace of the frame, after it has been published
+        """
+
+        elapsed = time.monotonic() - trace.capture_time
+        if elapsed > self.deadline:
+            self.missed_deadlines += 1
+
+        self.average_time += self.SMOOTHING * (elapsed - self.average_time)
+        for name, duration in trace.spans.items():
+            average = self.stage_times.get(name, duration)
+            self.stage_times[name] = average + self.SMOOTHING * (duration - average)
+
+        self.frames_since_change += 1
+        if self.frames_since_change <= self.settle_frames:
+            return
+
+        if self.average_time > self.degrade_at * self.deadline or elapsed > self.deadline:
+            self.frames_with_headroom = 0
+            if self.level < SKIP_FRAMES:
+                self.setLevel(self.level + 1)
+
+        elif self.average_time < self.restore_at * self.deadline:
+            self.frames_with_headroom += 1
+            if self.frames_with_headroom >= self.restore_frames and self.level > FULL_QUALITY:
+                self.setLevel(self.level - 1)
+
+        else:
+            self.frames_with_headroom = 0
+
+    def setLevel(self, level):
+        self.level = level
+        self.frames_since_change = 0
+        self.frames_with_headroom = 0
+
+    def metrics(self):
+        """
+        Get the state of the scheduler to publish with each result.
+        :return:                A dict of the scheduler's state, with times in milliseconds
+        """
+        return {
+            'level': self.level,
+            'name': LEVEL_NAMES[self.level],
+            'deadline': round(self.deadline * 1000, 3),
+            'average': round(self.average_time * 1000, 3),
+            'missed_deadlines': self.missed_deadlines,
+            'skipped_frames': self.skipped_frames,
+            'stages': {name: round(duration * 1000, 3) for name, duration in self.stage_times.items()}
+        }
+
+
+class BotTracker:
+    """
+    Match robots to groups of LEDs, remembering where each robot was last seen so that matching can be
+    skipped for robots that were confidently tracked, and so the groups nearest known robots are scored first.
+    """
+
+    def __init__(self, confident_score=5, track_distance=1, max_track_age=10):
+        """
+        :param confident_score: The highest matching score at which a robot is considered confidently tracked
+        :param track_distance:  The furthest a tracked robot may move between frames
+        :param max_track_age:   The number of frames a robot may be tracked without matching before it is matched again
+        """
+        self.confident_score = confident_score
+        self.track_distance = track_distance
+        self.max_track_age = max_track_age
+
+        # The (position, score, age) of each robot at the last frame, where age counts frames without matching
+        self.tracks = {}
+
+    def match(self, groups, bot_names, led_spacing=None, skip_confident=False, max_groups=None):
+        """
+        Find the position of each named robot among groups of LEDs.
+        :param groups:          A list of groups of LED positions, as made by groupNearbyPoints
+        :param bot_names:       The names of the patterns of the robots to locate
+        :param led_spacing:     The distance between adjacent LEDs of a robot, or None if it is not known
+        :param skip_confident:  If True, reuse the nearest group of the right size for confidently tracked robots
+        :param max_groups:      The largest number of groups to score, or None to score all of them
+        :return:                A dict of the center point of each robot, or None if it was not found
+        """
+
+        bot_positions = {}
+        remaining_bots = list(bot_names)
+        candidates = list(groups)
+
+        if skip_confident:
+            for bot in bot_names:
+                group = self.trackedGroup(bot, candidates)
+                if group is None:
+                    continue
+
+                position, score, age = self.tracks[bot]
+                bot_positions[bot] = botDetector.groupCenter(group)
+                self.tracks[bot] = (bot_positions[bot], score, age + 1)
+
+                remaining_bots.remove(bot)
+                candidates.remove(group)
+
+        if max_groups is not None and len(candidates) > max_groups:
+            # Score the groups nearest the robots' last known positions first
+            candidates.sort(key=self.distanceToTracks)
+            candidates = candidates[:max_groups]
+
+        for bot, (group, score) in botDetector.bestMatches(candidates, remaining_bots, led_spacing).items():
+            bot_positions[bot] = botDetector.groupCenter(group)
+
+            if group is None:
+                self.tracks.pop(bot, None)
+            else:
+                self.tracks[bot] = (bot_positions[bot], score, 0)
+
+        return bot_positions
+
+    def trackedGroup(self, bot, groups):
+        """
+        Get the group that a confidently tracked robot has most likely moved to.
+        :return:                The group with the robot's LED count nearest its last position, or None
+        """
+        track = self.tracks.get(bot)
+        if track is None:
+            return None
+
+        position, score, age = track
+        if score > self.confident_score or age >= self.max_track_age:
+            return None
+
+        pattern_size = botDetector.numPointsInPattern(botPatterns.patterns[bot.upper()])
+
+        nearest_group = None
+        nearest_distance = self.track_distance
+        for group in groups:
+            if len(group) != pattern_size:
+                continue
+
+            group_distance = botDetector.distance(position, botDetector.groupCenter(group))
+            if group_distance <= nearest_distance:
+                nearest_group = group
+                nearest_distance = group_distance
+
+        return nearest_group
+
+    def distanceToTracks(self, group):
+        center = botDetector.groupCenter(group)
+        distances = [botDetector.distance(position, center) for position, _, _ in self.tracks.values()]
+        return min(distances, default=float('inf'))
@@ -0,0 +1,530 @@
+import math
+import os
+import time
+
+import cv2
+import numpy
+
+import botPatterns
+
+
+class Frame:
+    """
+    A captured frame. The luminance plane used for detection and the full color image used for display and
+    recording are each only converted when they are first asked for, so frames that are dropped cost no conversion.
+    """
+
+    def __init__(self, index, timestamp, gray, image=None, image_loader=None, full_size=None, capture_time=None,
+                 gray_loader=None, detection_size=None):
+        """
+        :param index:           The number of frames read from the source before this one, used as its sequence number
+        :param timestamp:       The capture time of the frame in seconds, as wall clock time or time into a recording
+        :param gray:            The 8-bit luminance plane used for detection, which may be a view into the capture,
+                                or None if it is not available
+        :param image:           The full resolution color image, if it is already available
+        :param image_loader:    A function that returns the full resolution color image when it is not available
+        :param full_size:       The (width, height) of the full resolution image, or None if it is the size of gray
+        :param capture_time:    The time.monotonic() time at which the capture returned, taken before any conversion
+                                so that conversion counts towards latency, or None to use the current time
+        :param gray_loader:     A function that returns the luminance plane when it is not available
+        :param detection_size:  The (width, height) of the luminance plane, or None if it is the size of gray
+        """
+        self.index = index
+        self.timestamp = timestamp
+        self.capture_time = time.monotonic() if capture_time is None else capture_time
+
+        self._gray = gray
+        self._gray_loader = gray_loader
+        self._image = image
+        self._image_loader = image_loader
+
+        if detection_size is None:
+            detection_size = (gray.shape[1], gray.shape[0])
+        self.full_size = detection_size if full_size is None else full_size
+
+        # Factors to convert detection pixel coordinates to full resolution pixel coordinates
+        self.detection_scale = (self.full_size[0] / detection_size[0], self.full_size[1] / detection_size[1])
+
+    @property
+    def gray(self):
+        if self._gray is None:
+            self._gray = self._gray_loader()
+        return self._gray
+
+    @property
+    def image(self):
+        if self._image is None:
+            self._image = self._image_loader()
+        return self._image
+
+
+class FrameSource:
+    """
+    A source of frames, such as a camera or a recording.
+    Subclasses implement capture() and, if they hold any resources, release().
+    Sources that can change their exposure while running set supports_exposure and implement adjustExposure().
+    Sources given a BufferPool capture into its buffers where they can, so a frame's images are only valid until
+    the next frame is read.
+    """
+
+    supports_exposure = False
+
+    def __init__(self, buffers=None):
+        self.frame_index = 0
+        self.exposure = None
+        self.buffers = buffers
+
+    def capture(self, index):
+        """
+        Capture the next frame.
+        :param index:           The index to give the frame
+        :return:                The Frame, or None if the source has no more frames
+        """
+        raise NotImplementedError
+
+    def read(self):
+        frame = self.capture(self.frame_index)
+        if frame is not None:
+            self.frame_index += 1
+        return frame
+
+    def release(self):
+        pass
+
+    def adjustExposure(self, factor):
+        """
+        Scale the exposure of the source.
+        :param factor:          The factor to multiply the exposure time by, less than 1 to darken the frames
+        :return:                True if the exposure changed, False if it is already at its limit or not supported
+        """
+        return False
+
+    def __iter__(self):
+        while True:
+            frame = self.read()
+            if frame is None:
+                return
+            yield frame
+
+
+def downscaleForDetection(gray, size, dst=None):
+    """
+    Downscale a luminance plane to the given (width, height) for detection.
+    Nearest neighbor sampling keeps the LEDs as bright as they are in the full frame, where averaging the pixels
+    around them would dim small LEDs below the threshold.
+    """
+    return cv2.resize(gray, size, dst=dst, interpolation=cv2.INTER_NEAREST)
+
+
+def grayFromBGR(image, detection_size=None, buffers=None):
+    """
+    Get the luminance plane of a BGR image, downscaled to the detection size if one is given.
+    If a BufferPool is given, the luminance plane is written into its buffers instead of new arrays.
+    """
+    gray = None
+    if buffers is not None:
+        gray = buffers.buffer('gray', image.shape[:2])
+
+    gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY, dst=gray)
+
+    if detection_size is not None:
+        detection_gray = None
+        if buffers is not None:
+            detection_gray = buffers.buffer('detection', (detection_size[1], detection_size[0]))
+
+        gray = downscaleForDetection(gray, detection_size, detection_gray)
+
+    return gray
+
+
+def bgrFrame(index, timestamp, image, capture_time, detection_size=None, buffers=None):
+    """
+    Make a Frame from a captured color image, converting it to grayscale only once the frame is processed.
+    :param image:           The captured BGR image
+    :param detection_size:  The (width, height) to downscale the luminance plane to for detection, or None
+    :param buffers:         The BufferPool to convert into, or None to allocate new images
+    :return:                The Frame
+    """
+    full_size = (image.shape[1], image.shape[0])
+    return Frame(index, timestamp, None, image=image, full_size=full_size, capture_time=capture_time,
+                 gray_loader=lambda: grayFromBGR(image, detection_size, buffers),
+                 detection_size=full_size if detection_size is None else tuple(detection_size))
+
+
+def readInto(capture, buffers):
+    """
+    Read the next image from a cv2.VideoCapture, into the pooled capture buffer if a BufferPool is given.
+    :return:                The image, or None if there are no more images
+    """
+    if buffers is None:
+        ok, image = capture.read()
+    else:
+        ok, image = capture.read(image=buffers.get('capture'))
+        if ok:
+            buffers.keep('capture', image)
+
+    return image if ok else None
+
+
+class WebcamSource(FrameSource):
+    """
+    Frames from a webcam opened through cv2.VideoCapture.
+    """
+
+    supports_exposure = True
+
+    # Shortest webcam exposure value, which is the base 2 logarithm of the exposure time in seconds
+    MIN_EXPOSURE = -13
+
+    def __init__(self, width, height, exposure=0, device=0, detection_size=None, buffers=None):
+        super().__init__(buffers)
+        self.detection_size = detection_size
+
+        # Set up the default Windows webcam
+        self.vid = cv2.VideoCapture(device)
+        self.vid.set(cv2.CAP_PROP_FRAME_WIDTH, width)
+        self.vid.set(cv2.CAP_PROP_FRAME_HEIGHT, height)
+
+        # Limit the camera exposure to detect LEDs while filtering out other light sources
+        self.vid.set(cv2.CAP_PROP_EXPOSURE, exposure)
+        self.exposure = exposure
+
+        # Never expose for longer than configured, which would let the other light sources back in
+        self.max_exposure = exposure
+
+        if not self.vid.isOpened():
+            raise RuntimeError('Cannot open camera...')
+
+    def adjustExposure(self, factor):
+        # Webcams only take whole exposure values, so step by one, which doubles or halves the exposure time
+        step = -1 if factor < 1 else 1
+        exposure = min(self.max_exposure, max(self.MIN_EXPOSURE, self.exposure + step))
+        if exposure == self.exposure:
+            return False
+
+        self.vid.set(cv2.CAP_PROP_EXPOSURE, exposure)
+        self.exposure = exposure
+        return True
+
+    def capture(self, index):
+        image = readInto(self.vid, self.buffers)
+        capture_time = time.monotonic()
+        if image is None:
+            return None
+
+        return bgrFrame(index, time.time(), image, capture_time, self.detection_size, self.buffers)
+
+    def release(self):
+        self.vid.release()
+
+
+class PiCameraSource(FrameSource):
+    """
+    Frames from the Raspberry Pi camera through picamera2.
+    The camera captures YUV420, so the Y plane is used for detection directly as a zero-copy view of the capture.
+    If a detection size is given, the camera's low resolution stream is used for detection while the main stream
+    is kept at full resolution for display and recording.
+    """
+
+    supports_exposure = True
+
+    # Shortest exposure time in microseconds
+    MIN_EXPOSURE = 100
+
+    def __init__(self, width, height, exposure_factor, detection_size=None):
+        super().__init__()
+
+        # Pi-only module for operating the camera
+        # picamera2 does not need to be installed to run on a non-RPi system
+        from picamera2 import Picamera2
+
+        self.size = (width, height)
+        self.detection_size = detection_size
+
+        streams = {'main': {'format': 'YUV420', 'size': self.size}}
+        if detection_size is not None:
+            streams['lores'] = {'format': 'YUV420', 'size': detection_size}
+
+        # Set up the Raspberry Pi webcam
+        self.picam2 = Picamera2()
+        self.picam2.configure(self.picam2.create_preview_configuration(**streams))
+
+        self.picam2.start()
+        print('Configuring exposure...')
+        exposure = self.picam2.capture_metadata()['ExposureTime']
+        print(exposure)
+
+        # Stop the webcam and reduce exposure time, then restart the webcam
+        self.picam2.stop()
+        self.exposure = int(exposure * exposure_factor)
+
+        # Never expose for longer than configured, which would let the ambient light back in
+        self.max_exposure = self.exposure
+        self.picam2.set_controls({'ExposureTime': self.exposure})
+
+        self.picam2.start()
+
+    def adjustExposure(self, factor):
+        exposure = min(self.max_exposure, max(self.MIN_EXPOSURE, int(self.exposure * factor)))
+        if exposure == self.exposure:
+            return False
+
+        # Controls can be changed while the camera is running
+        self.picam2.set_controls({'ExposureTime': exposure})
+        self.exposure = exposure
+        return True
+
+    def capture(self, index):
+        timestamp = time.time()
+
+        if self.detection_size is None:
+            yuv = self.picam2.capture_array('main')
+            gray = yPlane(yuv, self.size)
+        else:
+            (yuv, lores), _ = self.picam2.capture_arrays(['main', 'lores'])
+            gray = yPlane(lores, self.detection_size)
+        capture_time = time.monotonic()
+
+        width, height = self.size
+        return Frame(index, timestamp, gray, image_loader=lambda: yuv420ToBGR(yuv, self.size),
+                     full_size=(width, height), capture_time=capture_time)
+
+    def release(self):
+        # Stop recording from the Pi's camera
+        self.picam2.stop()
+
+
+def yPlane(yuv, size):
+    """
+    Get the Y (luminance) plane of a YUV420 image as a view, without copying it.
+    :param yuv:             The YUV420 image as a 2D array with the Y plane in its first rows
+    :param size:            The (width, height) of the image, which may be narrower than the row stride
+    :return:                The Y plane
+    """
+    width, height = size
+    return yuv[:height, :width]
+
+
+def yuv420ToBGR(yuv, size):
+    """
+    Convert a YUV420 image to BGR.
+    picamera2 pads each row of the Y plane to the stride of the array and each row of the U and V planes to half
+    of it, so when the stride is wider than the image, the planes are cut out of the buffer and packed again.
+    :param yuv:             The YUV420 image as a 2D array, whose width is the row stride of the Y plane
+    :param size:            The (width, height) of the image
+    :return:                The BGR image
+    """
+    width, height = size
+    stride = yuv.shape[1]
+    if stride == width:
+        return cv2.cvtColor(yuv[:height * 3 // 2], cv2.COLOR_YUV2BGR_I420)
+
+    buffer = yuv.reshape(-1)
+    chroma_rows, chroma_stride, chroma_width = height // 2, stride // 2, width // 2
+    chroma_size = chroma_rows * chroma_stride
+    u_plane = buffer[stride * height:stride * height + chroma_size].reshape(chroma_rows, chroma_stride)
+    v_plane = buffer[stride * height + chroma_size:stride * height + 2 * chroma_size].reshape(chroma_rows,
+                                                                                              chroma_stride)
+
+    packed = numpy.empty((height * 3 // 2, width), dtype=numpy.uint8)
+    packed[:height] = yuv[:height, :width]
+    packed_chroma = packed.reshape(-1)[width * height:]
+    packed_chroma[:chroma_rows * chroma_width] = u_plane[:, :chroma_width].reshape(-1)
+    packed_chroma[chroma_rows * chroma_width:] = v_plane[:, :chroma_width].reshape(-1)
+
+    return cv2.cvtColor(packed, cv2.COLOR_YUV2BGR_I420)
+
+
+class VideoFileSource(FrameSource):
+    """
+    Frames from a video file, such as one made by main.makeVideo. Frames are timestamped using the video's frame rate.
+    """
+
+    def __init__(self, path, detection_size=None, buffers=None):
+        super().__init__(buffers)
+        self.detection_size = detection_size
+
+        self.video = cv2.VideoCapture(path)
+        if not self.video.isOpened():
+            raise RuntimeError('Cannot open video ' + path)
+
+        self.fps = self.video.get(cv2.CAP_PROP_FPS)
+        if self.fps <= 0:
+            self.fps = 1
+
+    def frameCount(self):
+        return int(self.video.get(cv2.CAP_PROP_FRAME_COUNT))
+
+    def capture(self, index):
+        image = readInto(self.video, self.buffers)
+        capture_time = time.monotonic()
+        if image is None:
+            return None
+
+        return bgrFrame(index, index / self.fps, image, capture_time, self.detection_size, self.buffers)
+
+    def release(self):
+        self.video.release()
+
+
+class ImageFolderSource(FrameSource):
+    """
+    Frames from a folder of .jpg images, such as a session recorded by main.run.
+    Images are named by their capture time, which is used as the frame timestamp.
+    """
+
+    def __init__(self, image_folder, detection_size=None):
+        super().__init__()
+        self.detection_size = detection_size
+
+        images = [img for img in sorted(os.listdir(image_folder)) if img.endswith('.jpg')]
+        self.images = [os.path.join(image_folder, img) for img in images]
+
+        # Index of the next image to read, which runs ahead of the frame index when unreadable images are skipped
+        self.image_index = 0
+
+    def frameCount(self):
+        return len(self.images)
+
+    def capture(self, index):
+        # Decode straight to grayscale so no color conversion is needed
+        # Images that can't be decoded, such as the last image of a session that was cut off, are skipped
+        gray = None
+        while gray is None:
+            if self.image_index >= len(self.images):
+                return None
+
+            path = self.images[self.image_index]
+            self.image_index += 1
+
+            gray = cv2.imread(path, cv2.IMREAD_GRAYSCALE)
+            if gray is None:
+                print('Skipping unreadable image ' + path)
+        capture_time = time.monotonic()
+
+        try:
+            timestamp = float(os.path.splitext(os.path.basename(path))[0])
+        except ValueError:
+            timestamp = float(index)
+
+        full_size = (gray.shape[1], gray.shape[0])
+        if self.detection_size is not None:
+            gray = downscaleForDetection(gray, self.detection_size)
+
+        return Frame(index, timestamp, gray, image_loader=lambda: cv2.imread(path), full_size=full_size,
+                     capture_time=capture_time)
+
+
+class SyntheticSource(FrameSource):
+    """
+    Generated frames of robots driving in circles with their LED patterns lit, for testing without a camera.
+    """
+
+    def __init__(self, width, height, bots, led_spacing=12, led_radius=3, fps=30, frame_limit=None, buffers=None):
+        """
+        :param width:           The width of the frames in pixels
+        :param height:          The height of the frames in pixels
+        :param bots:            The names of the patterns of the robots to draw
+        :param led_spacing:     The distance in pixels between horizontally or vertically adjacent LEDs
+        :param led_radius:      The radius of each LED in pixels
+        :param fps:             The frame rate used to timestamp and animate the frames
+        :param frame_limit:     The number of frames to generate, or None to generate frames forever
+        :param buffers:         A BufferPool to draw the frames into, or None to allocate each frame
+        """
+        super().__init__(buffers)
+        self.size = (width, height)
+        self.bots = bots
+        self.led_spacing = led_spacing
+        self.led_radius = led_radius
+        self.fps = fps
+        self.frame_limit = frame_limit
+
+    def frameCount(self):
+        return 0 if self.frame_limit is None else self.frame_limit
+
+    def capture(self, index):
+        if self.frame_limit is not None and index >= self.frame_limit:
+            return None
+
+        width, height = self.size
+        if self.buffers is None:
+            gray = numpy.zeros((height, width), dtype=numpy.uint8)
+        else:
+            gray = self.buffers.buffer('gray', (height, width))
+            gray.fill(0)
+
+        t = index / self.fps
+        orbit = min(width, height) / 3
+
+        for bot_idx, bot in enumerate(self.bots):
+
+            # Space the robots evenly around a circle that they all drive around, spinning as they go
+            angle = 2 * math.pi * (bot_idx / len(self.bots) + t / 20)
+            center_x = width / 2 + orbit * math.cos(angle)
+            center_y = height / 2 + orbit * math.sin(angle)
+            heading = t / 2 + bot_idx
+
+            for row_idx, row in enumerate(botPatterns.patterns[bot]):
+                for col_idx, state in enumerate(row):
+                    if state < 1:
+                        continue
+
+                    dx = (col_idx - 1) * self.led_spacing
+                    dy = (row_idx - 1) * self.led_spacing
+                    led_x = center_x + dx * math.cos(heading) - dy * math.sin(heading)
+                    led_y = center_y + dx * math.sin(heading) + dy * math.cos(heading)
+
+                    cv2.circle(gray, (int(led_x), int(led_y)), self.led_radius, 255, -1)
+
+        return Frame(index, t, gray, image_loader=lambda: cv2.cvtColor(gray, cv2.COLOR_GRAY2BGR),
+                     capture_time=time.monotonic())
+
+
+def openRecording(recording_path, detection_size=None, buffers=None):
+    """
+    Open a recorded session folder of .jpg images or a video file as a frame source.
+    """
+    if os.path.isdir(recording_path):
+        return ImageFolderSource(recording_path, detection_size)
+    return VideoFileSource(recording_path, detection_size, buffers)
+
+
+def openFrameSource(config, buffers=None):
+    """
+    Open the frame source selected by the config.
+    :param config:          The config dict
+    :param buffers:         A BufferPool for the source to capture into where it can, or None
+    :return:                The FrameSource
+    """
+
+    detection_size = None
+    if config['detection_width'] is not None and config['detection_height'] is not None:
+        detection_size = (config['detection_width'], config['detection_height'])
+
+    source = config['source']
+    if source == 'auto':
+        source = 'picamera' if config['is_rpi'] else 'webcam'
+
+    if source == 'picamera':
+        return PiCameraSource(config['cam_width'], config['cam_height'], config['exposure_factor'], detection_size)
+    if source == 'webcam':
+        return WebcamSource(config['cam_width'], config['cam_height'], config['exposure_factor'],
+                            detection_size=detection_size, buffers=buffers)
+    if source in ('video', 'folder'):
+        path = config['source_path']
+        if path is None:
+            raise ValueError("The '" + source + "' frame source needs a source_path (--source-path)")
+
+        if source == 'folder':
+            if not os.path.isdir(path):
+                raise ValueError(path + ' is not an image folder')
+            return ImageFolderSource(path, detection_size)
+
+        # Anything other than a folder is left to OpenCV, which also opens streams by URL
+        if os.path.isdir(path):
+            raise ValueError(path + " is a folder, use the 'folder' frame source to read its images")
+        return VideoFileSource(path, detection_size, buffers)
+    if source == 'synthetic':
+        return SyntheticSource(config['cam_width'], config['cam_height'], config['bots_in_play'], buffers=buffers)
+
+    raise ValueError('Unknown frame source: ' + source)
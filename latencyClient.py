@@ -0,0 +1,227 @@
+import argparse
+import json
+import os
+import socket
+import subprocess
+import sys
+import time
+
+# Upper edges of the histogram buckets in milliseconds
+HISTOGRAM_EDGES = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)
+
+# Number of packets between reports
+REPORT_INTERVAL = 100
+
+
+def histogram(values):
+    """
+    Count values into the HISTOGRAM_EDGES buckets.
+    :param values:          The values to count, in milliseconds
+    :return:                A list of counts, with one more bucket than edges for values above the last edge
+    """
+    counts = [0] * (len(HISTOGRAM_EDGES) + 1)
+    for value in values:
+        bucket = 0
+        while bucket < len(HISTOGRAM_EDGES) and value > HISTOGRAM_EDGES[bucket]:
+            bucket += 1
+        counts[bucket] += 1
+
+    return counts
+
+
+def printHistogram(title, values):
+    if len(values) < 1:
+        return
+
+    ordered = sorted(values)
+    print('{}: mean {:.2f} ms, median {:.2f} ms, p99 {:.2f} ms, max {:.2f} ms'.format(
+        title, sum(values) / len(values), ordered[len(ordered) // 2], ordered[int(len(ordered) * 0.99)],
+        ordered[-1]))
+
+    counts = histogram(values)
+    lower = 0
+    for bucket, count in enumerate(counts):
+        upper = '{:g}'.format(HISTOGRAM_EDGES[bucket]) if bucket < len(HISTOGRAM_EDGES) else 'inf'
+        bar = '#' * int(50 * count / len(values))
+        print('  {:>5}-{:<5} ms {:6d} {}'.format('{:g}'.format(lower), upper, count, bar))
+        if bucket < len(HISTOGRAM_EDGES):
+            lower = HISTOGRAM_EDGES[bucket]
+
+
+class LatencyStats:
+    """
+    Latency from capture to receipt of each packet, the jitter between consecutive packets,
+    and the mean time spent in each traced stage.
+    """
+
+    def __init__(self):
+        self.latencies = []
+        self.jitters = []
+        self.span_totals = {}
+        self.span_counts = {}
+        self.dropped_frames = 0
+        self.last_frame = None
+
+    def add(self, trace, receipt_time):
+        latency = (receipt_time - trace['capture']) * 1000
+        if len(self.latencies) > 0:
+            self.jitters.append(abs(latency - self.latencies[-1]))
+        self.latencies.append(latency)
+
+        if self.last_frame is not None and trace['frame'] > self.last_frame + 1:
+            self.dropped_frames += trace['frame'] - self.last_frame - 1
+        self.last_frame = trace['frame']
+
+        spans = dict(trace['spans'])
+        spans['publish_to_receipt'] = (receipt_time - trace['publish']) * 1000
+        for name, duration in trace.get('previous_publish', {}).items():
+            spans['previous_' + name] = duration
+
+        for name, duration in spans.items():
+            self.span_totals[name] = self.span_totals.get(name, 0) + duration
+            self.span_counts[name] = self.span_counts.get(name, 0) + 1
+
+    def report(self):
+        print('{} packets, {} frames not received'.format(len(self.latencies), self.dropped_frames))
+        printHistogram('Capture to receipt latency', self.latencies)
+        printHistogram('Jitter', self.jitters)
+
+        print('Mean stage times:')
+        for name in self.span_totals:
+            print('  {:<24}{:8.3f} ms'.format(name, self.span_totals[name] / self.span_counts[name]))
+
+
+def connect(host, port, timeout):
+    """
+    Connect to the server, retrying until it is listening or the timeout passes.
+    """
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            return socket.create_connection((host, port))
+        except OSError:
+            if time.monotonic() > deadline:
+                raise
+            time.sleep(0.1)
+
+
+def receivePackets(conn, packet_size):
+    """
+    Receive JSON packets from the server. Packets are not delimited, so a packet that arrives in the same read as
+    the one before it, such as the first position packet after the config packet, is split from it here.
+    :param conn:            The connected socket
+    :param packet_size:     The number of bytes to read at a time
+    :return:                A generator of (packet, receipt time) tuples
+    """
+    decoder = json.JSONDecoder()
+    buffer = ''
+
+    while True:
+        data = conn.recv(packet_size)
+        receipt_time = time.monotonic()
+        if not data:
+            return
+
+        buffer += data.decode()
+        while True:
+            buffer = buffer.lstrip()
+            try:
+                packet, end = decoder.raw_decode(buffer)
+            except json.JSONDecodeError:
+                break
+
+            buffer = buffer[end:]
+            yield packet, receipt_time
+
+
+def measure(host, port, frames=None, timeout=30, subscription=None):
+    """
+    Receive packets from the server and measure their latency.
+    Latency is only meaningful when the client runs on the same host as the server, since it compares
+    monotonic clock readings; from another host, only the jitter is meaningful.
+    :param host:            The host name of the server
+    :param port:            The TCP port of the server
+    :param frames:          The number of packets to receive, or None to receive until the server closes
+    :param timeout:         Seconds to keep trying to connect
+    :param subscription:    A dict of the robots, maximum rate and on-change setting to subscribe to, or None for all
+    :return:                The LatencyStats
+    """
+
+    conn = connect(host, port, timeout)
+
+    stats = LatencyStats()
+    try:
+        for packet, receipt_time in receivePackets(conn, 4096):
+
+            # The first packet configures the client and is not a position packet
+            if 'PACKET_SIZE' in packet:
+                if subscription is not None:
+                    conn.send(json.dumps({'SUBSCRIBE': subscription}).encode())
+                continue
+
+            if 'TRACE' in packet:
+                stats.add(packet['TRACE'], receipt_time)
+
+            # The server waits for a reply before sending the next packet
+            conn.send(b'ok')
+
+            if len(stats.latencies) > 0 and len(stats.latencies) % REPORT_INTERVAL == 0:
+                stats.report()
+
+            if frames is not None and len(stats.latencies) >= frames:
+                break
+    except KeyboardInterrupt:
+        pass
+    finally:
+        conn.close()
+
+    return stats
+
+
+def parseArgs():
+    parser = argparse.ArgumentParser(description='Measure the latency of robot positions from capture to receipt.')
+    parser.add_argument('--host', default='localhost', help='host name of the server')
+    parser.add_argument('--port', type=int, default=5000, help='TCP port of the server')
+    parser.add_argument('-n', '--frames', type=int, default=None, help='number of packets to measure')
+    parser.add_argument('--bots', nargs='+', default=None, help='robot IDs to subscribe to (default: all)')
+    parser.add_argument('--max-rate', type=float, default=None, help='maximum update rate to subscribe to in Hz')
+    parser.add_argument('--on-change', action='store_true', help='subscribe to updates only when robots move')
+    parser.add_argument('--with-server', action='store_true',
+                        help='start main.py on this host and measure it; arguments after -- are passed to it')
+    parser.add_argument('server_args', nargs=argparse.REMAINDER, help=argparse.SUPPRESS)
+    return parser.parse_args()
+
+
+def main():
+    args = parseArgs()
+
+    server = None
+    if args.with_server:
+        server_args = [arg for arg in args.server_args if arg != '--']
+        if len(server_args) < 1:
+            server_args = ['--source', 'synthetic', '--no-display']
+
+        main_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'main.py')
+        server = subprocess.Popen([sys.executable, main_path, '--server', '--port', str(args.port)] + server_args,
+                                  stdout=subprocess.DEVNULL)
+
+    frames = args.frames
+    if frames is None and server is not None:
+        frames = 1000
+
+    subscription = None
+    if args.bots is not None or args.max_rate is not None or args.on_change:
+        subscription = {'bots': args.bots, 'max_rate': args.max_rate, 'on_change': args.on_change}
+
+    try:
+        stats = measure(args.host, args.port, frames, subscription=subscription)
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+
+    stats.report()
+
+
+if __name__ == '__main__':
+    main()
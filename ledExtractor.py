@@ -0,0 +1,106 @@
+import cv2
+import numpy
+
+# Grayscale brightness above which a pixel is considered part of an LED
+LED_THRESHOLD = 230
+
+
+#  Define a function to perform the contour detection
+def getAllContours(grayscale_img, buffers=None):
+    edges = None
+    if buffers is not None:
+        edges = buffers.sizedBuffer('edges', grayscale_img.shape)
+
+    canny = cv2.Canny(grayscale_img, 50, 240, edges=edges)
+    contours, _ = cv2.findContours(canny, cv2.RETR_LIST, cv2.CHAIN_APPROX_NONE)
+    return contours
+
+
+def thresholdLEDs(gray_frame, threshold=LED_THRESHOLD, buffers=None):
+    """
+    Identify bright spots in a grayscale frame, such as LEDs, and put them in a binary image.
+    :param gray_frame:      The grayscale image to search
+    :param threshold:       The minimum brightness of a pixel to be considered part of an LED
+    :param buffers:         A BufferPool to write the binary image into, or None to allocate it
+    :return:                The binary image
+    """
+    binary_m = None
+    if buffers is not None:
+        binary_m = buffers.sizedBuffer('binary', gray_frame.shape)
+
+    _, binary_m = cv2.threshold(gray_frame, threshold, 255, cv2.THRESH_BINARY, dst=binary_m)
+    return binary_m
+
+
+def findLEDContours(gray_frame, threshold=LED_THRESHOLD, buffers=None):
+    """
+    Find the bright spots in a grayscale frame that could be LEDs.
+    :param gray_frame:      The grayscale image to search
+    :param threshold:       The minimum brightness of a pixel to be considered part of an LED
+    :param buffers:         A BufferPool to write the intermediate images into, or None to allocate them
+    :return:                A list of (contour, (x, y)) tuples with the contour of each LED and its center in pixels
+    """
+    return binaryLEDContours(thresholdLEDs(gray_frame, threshold, buffers), buffers)
+
+
+def binaryLEDContours(binary_m, buffers=None):
+    """
+    Find the contours of the bright spots in a binary image made by thresholdLEDs.
+    :param binary_m:        The binary image
+    :param buffers:         A BufferPool to write the edge image into, or None to allocate it
+    :return:                A list of (contour, (x, y)) tuples with the contour of each LED and its center in pixels
+    """
+
+    # Get all contours (boundaries of the white spots) in the binary image
+    contours = getAllContours(binary_m, buffers)
+
+    LED_contours = []
+    for contour in contours:
+
+        # Get the center point of the contour
+        M = cv2.moments(contour)
+        if M['m00'] != 0 and cv2.contourArea(contour) > 1:
+            cX = int(M['m10'] / M['m00'])
+            cY = int(M['m01'] / M['m00'])
+
+            LED_contours.append((contour, (cX, cY)))
+
+    return LED_contours
+
+
+def countBlobs(binary_m, buffers=None):
+    """
+    Count the distinct bright spots in a binary image made by thresholdLEDs.
+    Edge detection finds both an outer and an inner contour around each spot, so the contours can't be counted
+    instead. Labelling connected pixels takes one pass over the image however many spots there are.
+    :param binary_m:        The binary image
+    :param buffers:         A BufferPool to write the label image into, or None to allocate it
+    :return:                The number of distinct spots
+    """
+    labels = None
+    if buffers is not None:
+        labels = buffers.sizedBuffer('labels', binary_m.shape, numpy.int32)
+
+    # The background is counted as a label of its own
+    label_count, _ = cv2.connectedComponents(binary_m, labels=labels, connectivity=8, ltype=cv2.CV_32S)
+    return label_count - 1
+
+
+def findLEDs(gray_frame, cam, threshold=LED_THRESHOLD, buffers=None):
+    """
+    Find the field positions of all LEDs visible in a grayscale frame.
+    :param gray_frame:      The grayscale image to search
+    :param cam:             The OverheadCamera used to convert pixel coordinates to field coordinates
+    :param threshold:       The minimum brightness of a pixel to be considered part of an LED
+    :param buffers:         A BufferPool to write the intermediate images into, or None to allocate them
+    :return:                A list of LED positions on the field as (x, y) tuples
+    """
+
+    LEDs = []
+    for _, (cX, cY) in findLEDContours(gray_frame, threshold, buffers):
+
+        # Convert the pixel coordinates to field coordinates
+        x, y, z = cam.pixelsToCartesian(cX, cY)
+        LEDs.append((x, y))
+
+    return LEDs
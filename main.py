@@ -1,57 +1,50 @@
-import datetime
-import os
-import select
-import shutil
-import socket
 import time
-import json
-
-import cv2
 
-import botDetector
-from OverheadCamera import OverheadCamera as oc
-from botDetector import *
+# Mark the start of the process as early as possible so the startup report covers the imports below
+STARTUP_START = time.perf_counter()
 
+import argparse
+import datetime
+import math
+import os
+import shutil
 
-def getPitch():
-    mag_x, mag_y, mag_z = sensor.magnetic
-    pitch_rad = math.atan2(mag_y, math.sqrt(mag_x ** 2 + mag_z ** 2))
-    pitch_deg = math.degrees(pitch_rad) % 360
-
-    return pitch_deg
-
+import config as run_config
 
-# Run parameters
-RUN_SERVER = True  # Will run a server and wait for a client connection if True
-IS_RPI = False  # Set to True for the Raspberry Pi, False to test on a Windows computer
-DISPLAY = True # Will only open a window to view the camera frames if this is True
-SAVE_FRAME_RATE = 0  # Frame rate to save captured images for later viewing. Will not save if set to 0 or negative.
-HAS_COMPASS = False  # If True, will attempt to use a magnetometer to find the compass heading of the field's major axis
-RUN_DETECTION = True    # If True, will execute robot detection algorithm. If not, will
 
-PACKET_SIZE = 1024
+class StartupTimer:
+    """
+    Record how long each stage of startup takes, up to the first published frame.
+    """
 
+    def __init__(self, start):
+        self.start = start
+        self.mark = start
+        self.stages = []
 
-def configDataPacket():
+    def stage(self, name):
+        now = time.perf_counter()
+        self.stages.append((name, now - self.mark))
+        self.mark = now
 
-    data_dict = {
-        'FPS': SAVE_FRAME_RATE,
-        'PACKET_SIZE': PACKET_SIZE
-    }
+    def report(self):
+        print('Startup time report:')
+        for name, duration in self.stages:
+            print('  {:<24}{:8.1f} ms'.format(name, duration * 1000))
+        print('  {:<24}{:8.1f} ms'.format('total', (self.mark - self.start) * 1000))
 
-    data = json.dumps(data_dict)
 
-    return data
+def getPitch(sensor):
+    mag_x, mag_y, mag_z = sensor.magnetic
+    pitch_rad = math.atan2(mag_y, math.sqrt(mag_x ** 2 + mag_z ** 2))
+    pitch_deg = math.degrees(pitch_rad) % 360
 
+    return pitch_deg
 
-#  Define a function to perform the contour detection
-def getAllContours(grayscale_img):
-    canny = cv2.Canny(grayscale_img, 50, 240)
-    contours, _ = cv2.findContours(canny, cv2.RETR_LIST, cv2.CHAIN_APPROX_NONE)
-    return contours
 
+def makeVideo(name, image_folder, frame_rate):
+    import cv2
 
-def makeVideo(name, image_folder):
     images = [img for img in sorted(os.listdir(image_folder)) if img.endswith('.jpg')]
     if len(images) < 1:
         return
@@ -60,7 +53,7 @@ def makeVideo(name, image_folder):
     height, width, layers = frame.shape
 
     fourcc = cv2.VideoWriter_fourcc(*'mp4v')
-    video = cv2.VideoWriter(name + '.mp4', fourcc, SAVE_FRAME_RATE, (width, height))
+    video = cv2.VideoWriter(name + '.mp4', fourcc, frame_rate, (width, height))
 
     for image in images:
         video.write(cv2.imread(os.path.join(image_folder, image)))
@@ -68,115 +61,102 @@ def makeVideo(name, image_folder):
     video.release()
 
 
-CAM_WIDTH = 4656  # Width of the camera frame in pixels
-CAM_HEIGHT = 3496  # Height of the camera frame in pixels
-CAM_FOV_WIDTH = 110  # Width of the camera frame in degrees, also called horizontal field of view
-CAM_FOV_HEIGHT = 95  # Height of the camera frame in degrees, also called vertical field of view
-
-# Configure the camera
-if IS_RPI:
-
-    # Pi-only module for operating the camera
-    # picamera2 does not need to be installed to run on a non-RPi system
-    from picamera2 import Picamera2
-
-    CAM_WIDTH = 4656
-    CAM_HEIGHT = 3496
-    CAM_FOV_WIDTH = 110
-    CAM_FOV_HEIGHT = 95
-
-    # Set up the Raspberry Pi webcam
-    picam2 = Picamera2()
-    picam2.configure(picam2.create_preview_configuration(main={'format': 'XRGB8888', 'size': (CAM_WIDTH, CAM_HEIGHT)}))
-
-    picam2.start()
-    print('Configuring exposure...')
-    exposure = picam2.capture_metadata()['ExposureTime']
-    print(exposure)
-
-    # Factor to adjust exposure time
-    # 1/12 seems to work
-    exposure_factor = 1 / 12
-
-    # Stop the webcam and reduce exposure time, then restart the webcam
-    picam2.stop()
-    picam2.set_controls({'ExposureTime': int(exposure * exposure_factor)})
-
-    picam2.start()
-
-    if HAS_COMPASS:
-        # Pi-only imports to operate the magnetometer (digital compass)
-        import adafruit_lis3mdl
-        import board
-        import busio
-        import math
-
-        # Configure the magnetometer
-        i2c = busio.I2C(board.SCL, board.SDA)
-        sensor = adafruit_lis3mdl.LIS3MDL(i2c)
-
-else:
-
-    # Typical settings for a widescreen laptop webcam
-    CAM_WIDTH = 1280
-    CAM_HEIGHT = 720
-    CAM_FOV_WIDTH = 65
-    CAM_FOV_HEIGHT = 37
-
-    # Limit the camera exposure to detect LEDs while filtering out other light sources
-    # -8 seems to work for testing
-    exposure_factor = 0#-8
-
-    # Set up the default Windows webcam
-    vid = cv2.VideoCapture(0)
-    vid.set(cv2.CAP_PROP_FRAME_WIDTH, CAM_WIDTH)
-    vid.set(cv2.CAP_PROP_FRAME_HEIGHT, CAM_HEIGHT)
-    vid.set(cv2.CAP_PROP_EXPOSURE, exposure_factor)
-
-    if not vid.isOpened():
-        print('Cannot open camera...')
-        exit()
-
-# Define the overhead camera object that performs coordinate transformations
-# Use feet for the height and offset measurements to ensure the output of the algorithm is also in feet
-cam = oc(
-    field_of_view=(CAM_FOV_WIDTH, CAM_FOV_HEIGHT),
-    phi=90,
-    image_size=(CAM_WIDTH, CAM_HEIGHT),
-    midfield_offset=0,
-    sideline_offset=0,
-    height=19+8/12,
-    bot_height=1+10/12
-)
-
-# Start the TCP server
-if RUN_SERVER:
-    print('Starting server...')
-
-    host = socket.gethostname()
-    port = 5000
-
-    # Open the TCP socket at the given port
-    server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-    server_socket.bind(('', port))
-    server_socket.listen(1)
-    print('Listening for TCP session requests at ' + host + ':' + str(port))
-
-    conn, address = server_socket.accept()
-    print('Accepting TCP session from ' + str(address))
-
-    conn.send(configDataPacket().encode())
+def openCompass():
+    # Pi-only imports to operate the magnetometer (digital compass)
+    import adafruit_lis3mdl
+    import board
+    import busio
+
+    # Configure the magnetometer
+    i2c = busio.I2C(board.SCL, board.SDA)
+    return adafruit_lis3mdl.LIS3MDL(i2c)
+
+
+def run(config, timer=None):
+    """
+    Capture frames, detect the robots in them, and publish their positions until q is pressed.
+    :param config:          The config dict
+    :param timer:           A StartupTimer to report on once the first frame is published, or None
+    """
+
+    if timer is None:
+        timer = StartupTimer(time.perf_counter())
+
+    # Heavy modules are imported here rather than at the top so that --help and config errors are fast
+    import cv2
+
+    import botDetector
+    import bufferPool
+    import frameScheduler
+    import frameSources
+    import ledExtractor
+    import positionServer
+    import thresholdController
+    import tracing
+    from OverheadCamera import OverheadCamera as oc
+    timer.stage('imports')
+
+    server = None
+    if config['run_server']:
+        server = positionServer.PositionServer(config)
+        timer.stage('server socket')
+
+    # Size the buffers used by every frame once, so processing a frame allocates no new full-size images
+    buffers = bufferPool.BufferPool()
+    if config['detection_width'] is not None and config['detection_height'] is not None:
+        detection_width, detection_height = config['detection_width'], config['detection_height']
+    else:
+        detection_width, detection_height = config['cam_width'], config['cam_height']
+    buffers.preallocate(detection_width, detection_height)
+
+    # The scheduler may also extract LEDs from downscaled frames, which need buffers of their own
+    if config['frame_deadline_ms'] is not None:
+        factor = frameScheduler.DOWNSCALE_FACTOR
+        buffers.buffer('downscaled', (detection_height // factor, detection_width // factor))
+        buffers.preallocate(detection_width // factor, detection_height // factor)
+    timer.stage('buffer pool')
+
+    source = frameSources.openFrameSource(config, buffers)
+    timer.stage('frame source')
+
+    controller = None
+    if config['adaptive_threshold']:
+        controller = thresholdController.ThresholdController(
+            thresholdController.expectedLEDCount(config['bots_in_play']),
+            threshold=config['threshold'],
+            min_threshold=config['min_threshold'],
+            max_threshold=config['max_threshold'],
+            band=config['candidate_band'],
+            source=source
+        )
+    threshold = config['threshold']
+
+    scheduler = None
+    tracker = None
+    if config['frame_deadline_ms'] is not None:
+        scheduler = frameScheduler.FrameScheduler(config['frame_deadline_ms'] / 1000)
+        tracker = frameScheduler.BotTracker(config['confident_score'], config['track_distance'])
+
+    sensor = None
+    if config['has_compass']:
+        sensor = openCompass()
+        timer.stage('compass')
+
+    # The overhead camera is defined from the first frame, since recorded and synthetic sources set their own size
+    cam = None
+
+    if server is not None:
+        server.waitForClient()
+        timer.stage('client connection')
 
-
-def main():
     # Get a unique name for the recording of the session
     session_name = 'recording_' + datetime.datetime.now().strftime('%Y_%m_%d__%H_%M_%S')
 
     # Determine whether to record the session based on the given frame rate
     record = False
     frame_interval = math.inf
-    if SAVE_FRAME_RATE > 0:
-        frame_interval = 1 / SAVE_FRAME_RATE
+    if config['save_frame_rate'] > 0:
+        frame_interval = 1 / config['save_frame_rate']
         record = True
 
         # If the application needs to record, make an empty folder in which to save images
@@ -188,126 +168,198 @@ def main():
     start = time.time()
     mark = start
 
+    first_frame = True
+
     # Main loop
     while True:
 
-        # Capture a frame from the webcam
-        if IS_RPI:
-            frame = picam2.capture_array()
-        else:
-            _, frame = vid.read()
-
-        # If q is pressed, stop the main loop
-        if cv2.waitKey(1) & 0xFF == ord('q'):
+        # Capture a frame from the frame source
+        frame = source.read()
+        if frame is None:
             break
 
-        # Convert frame to grayscale
-        gray_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        # Drop the frame if the scheduler needs to catch up
+        if scheduler is not None and not scheduler.shouldProcess(frame):
+            continue
+
+        # Time each stage from the moment the capture returned, so the capture span covers color conversion,
+        # which only happens now that the frame is known to be processed
+        trace = tracing.FrameTrace(frame.index, frame.capture_time)
+        gray_frame = frame.gray
+        trace.span('capture')
+
+        if cam is None:
+            cam = run_config.makeOverheadCamera(config, image_size=frame.full_size)
+
+        # The color image is only needed, and only converted, when it will be shown or saved
+        now = time.time()
+        save_frame = record and now - mark >= 0
+        annotate = config['display'] or save_frame
+
+        # Detection may run on a lower resolution stream than the full resolution image
+        scale_x, scale_y = frame.detection_scale
+
+        # Downscale the frame when the scheduler needs to save time
+        if scheduler is not None and scheduler.level >= frameScheduler.DOWNSCALE:
+            factor = frameScheduler.DOWNSCALE_FACTOR
+            height, width = gray_frame.shape[0] // factor, gray_frame.shape[1] // factor
+            gray_frame = frameSources.downscaleForDetection(gray_frame, (width, height),
+                                                            buffers.buffer('downscaled', (height, width)))
+            scale_x *= frame.gray.shape[1] / gray_frame.shape[1]
+            scale_y *= frame.gray.shape[0] / gray_frame.shape[0]
 
-        # Identify bright spots in the image such as LEDs and put them in a binary image
-        _, binary_m = cv2.threshold(gray_frame, 230, 255, cv2.THRESH_BINARY)
+        binary_frame = ledExtractor.thresholdLEDs(gray_frame, threshold, buffers)
+        LED_contours = ledExtractor.binaryLEDContours(binary_frame, buffers)
 
-        # Get all contours (boundaries of the white spots) in the binary image
-        contours = getAllContours(binary_m)
+        # Adjust the threshold for the next frame to keep the number of LED candidates bounded
+        if controller is not None:
+            threshold = controller.update(ledExtractor.countBlobs(binary_frame, buffers))
+        trace.span('extraction')
 
         # Get a list of the center points of all LEDs
         LEDs = []
+        LED_pixels = []
 
-        # Print each contour on the original frame
-        for contour in contours:
+        for contour, (cX, cY) in LED_contours:
 
-            # Get the center point of the contour
-            M = cv2.moments(contour)
-            if M["m00"] != 0 and cv2.contourArea(contour) > 1:
-                # Draw the contour
-                cv2.drawContours(frame, [contour], -1, (255, 255, 0), 3)
+            # Convert the center to full resolution pixel coordinates
+            cX = int(cX * scale_x)
+            cY = int(cY * scale_y)
+            LED_pixels.append((cX, cY))
 
-                # Find and draw the contour's center
-                cX = int(M['m10'] / M['m00'])
-                cY = int(M['m01'] / M['m00'])
+            # Convert the pixel coordinates to field coordinates
+            x, y, z = cam.pixelsToCartesian(cX, cY)
+            LEDs.append((x, y))
+        trace.span('pixels_to_cartesian')
 
-                cv2.circle(frame, (cX, cY), 4, (0, 255, 255), -1)
+        if annotate:
+            for (contour, _), (cX, cY), (x, y) in zip(LED_contours, LED_pixels, LEDs):
 
-                # Convert the pixel coordinates to field coordinates
-                x, y, z = cam.pixelsToCartesian(cX, cY)
-                LEDs.append((x, y))
+                # Draw the contour and its center on the original frame
+                if (scale_x, scale_y) != (1, 1):
+                    contour = (contour * (scale_x, scale_y)).astype(contour.dtype)
+                cv2.drawContours(frame.image, [contour], -1, (255, 255, 0), 3)
+                cv2.circle(frame.image, (cX, cY), 4, (0, 255, 255), -1)
 
-                cv2.putText(frame, 'LED position: {:.2f}, {:.2f}'.format(x, y), (cX, cY), cv2.FONT_HERSHEY_PLAIN, 1,
-                            (0, 255, 0), 2, cv2.LINE_AA)
+                cv2.putText(frame.image, 'LED position: {:.2f}, {:.2f}'.format(x, y), (cX, cY),
+                            cv2.FONT_HERSHEY_PLAIN, 1, (0, 255, 0), 2, cv2.LINE_AA)
 
-        if record:
+        if save_frame:
             # If the current time exceeds the time at which the next frame should be captured, save the current frame
-            now = time.time()
-            if now - mark >= 0:
-                mark = mark + frame_interval
+            mark = mark + frame_interval
 
-                cv2.imwrite(session_name + '/' + str(now) + '.jpg', frame)
+            cv2.imwrite(session_name + '/' + str(now) + '.jpg', frame.image)
+
+        # Drawing and saving are not part of the path to the client
+        trace.skip()
 
-        bots_in_play = ('X', 'Y', 'STAIR', 'H', 'L')
         bot_positions = {
             'CAM': (cam.x_offset + oc.FIELD_LENGTH, cam.y_offset + oc.FIELD_WIDTH)
         }
 
-        groups = botDetector.groupNearbyPoints(LEDs, 1)
-
-        for bot_pattern in bots_in_play:
-            best_score = math.inf
-            best_bot = None
+        # Fields sent with the positions to every client
+        extras = {}
 
-            for group in groups:
+        if config['run_detection']:
+            groups = botDetector.groupNearbyPoints(LEDs, config['group_distance'])
+            trace.span('grouping')
 
-                if len(group) < 1:
-                    continue
+            if tracker is None:
+                bot_positions.update(botDetector.matchGroups(groups, config['bots_in_play'], config['led_spacing']))
+            else:
+                max_groups = config['max_groups'] if scheduler.level >= frameScheduler.LIMIT_GROUPS else None
+                bot_positions.update(tracker.match(groups, config['bots_in_play'], config['led_spacing'],
+                                                   skip_confident=scheduler.level >= frameScheduler.TRACK_CONFIDENT,
+                                                   max_groups=max_groups))
+            trace.span('detect_shape')
 
-                score = botDetector.detectShape(group, botPatterns.getPattern(bot_pattern))
-                if score < best_score:
-                    best_bot = group
-                    best_score = score
-                    print('Matching score: ' + str(score))
+        if controller is not None:
+            extras['CONTROLLER'] = controller.metrics()
 
-            bot_position = botDetector.groupCenter(best_bot)
-            bot_positions[bot_pattern] = bot_position
+        if scheduler is not None:
+            extras['QUALITY'] = scheduler.metrics()
 
-        if HAS_COMPASS:
-            angle = getPitch()
+        if sensor is not None:
+            angle = getPitch(sensor)
             print('Compass heading: ' + str(angle))
 
-        # If the server is running, transmit the points to the client
-        if RUN_SERVER:
-            try:
-                data = json.dumps(bot_positions)
+        # If the server is running, transmit the points to the clients
+        if server is not None:
+            server.publish(bot_positions, extras, trace)
+
+        if scheduler is not None:
+            scheduler.endFrame(trace)
 
-                print('Sending ' + data)
-                conn.send(data.encode())
+        # Show the frame once it has been published, so waiting for the window to draw it is not counted as capture
+        if config['display']:
+            cv2.imshow('frame', frame.image)
 
-                conn.recv(PACKET_SIZE).decode()
-            except BrokenPipeError:
-                print("The client suddenly closed. Continuing to listen...")
+            # If q is pressed, stop the main loop
+            if cv2.waitKey(1) & 0xFF == ord('q'):
+                break
 
-        if DISPLAY:
-            cv2.imshow('frame', frame)
+        if first_frame:
+            first_frame = False
+            timer.stage('first frame')
+            timer.report()
 
-    # Close the TCP socket
-    if RUN_SERVER:
-        conn.close()
-        print('TCP socket closed...')
+    if config['run_detection']:
+        print('Shape checks: ' + ', '.join('{} {}'.format(stage, count)
+                                          for stage, count in botDetector.rejection_counts.items()))
+
+    # Close the TCP sockets
+    if server is not None:
+        server.close()
 
     # Destroy the display window for the live view
-    if DISPLAY:
+    if config['display']:
         cv2.destroyAllWindows()
 
-    if IS_RPI:
-        # Stop recording from the Pi's camera
-        picam2.stop()
-    else:
-        # Stop recording from the Windows camera
-        vid.release()
+    # Stop recording from the camera
+    source.release()
 
     # Convert the saved images to a video
     if record:
-        makeVideo(name=session_name, image_folder=session_name)
+        makeVideo(name=session_name, image_folder=session_name, frame_rate=config['save_frame_rate'])
+
+
+def parseArgs(argv=None):
+    parser = argparse.ArgumentParser(description='Detect LED signatures of robots and publish their positions.')
+    parser.add_argument('-c', '--config', help='JSON file of config values (see config.DEFAULT_CONFIG)')
+    parser.add_argument('--rpi', dest='is_rpi', action=argparse.BooleanOptionalAction, default=None,
+                        help='use the Raspberry Pi camera instead of a webcam')
+    parser.add_argument('--server', dest='run_server', action=argparse.BooleanOptionalAction, default=None,
+                        help='wait for a client and publish robot positions to it')
+    parser.add_argument('--display', action=argparse.BooleanOptionalAction, default=None,
+                        help='show the camera frames in a window')
+    parser.add_argument('--compass', dest='has_compass', action=argparse.BooleanOptionalAction, default=None,
+                        help='read the field heading from a magnetometer')
+    parser.add_argument('--detection', dest='run_detection', action=argparse.BooleanOptionalAction, default=None,
+                        help='run the robot detection algorithm')
+    parser.add_argument('--save-fps', dest='save_frame_rate', type=float, default=None,
+                        help='frame rate at which to record frames, 0 to not record')
+    parser.add_argument('--source', choices=('auto', 'picamera', 'webcam', 'video', 'folder', 'synthetic'),
+                        default=None, help='where to read frames from')
+    parser.add_argument('--source-path', default=None, help='video file or image folder to read frames from')
+    parser.add_argument('--deadline', dest='frame_deadline_ms', type=float, default=None,
+                        help='frame deadline in milliseconds, degrading quality to meet it')
+    parser.add_argument('--port', type=int, default=None, help='TCP port of the server')
+    parser.add_argument('--threshold', type=int, default=None, help='LED brightness threshold')
+    parser.add_argument('--adaptive-threshold', dest='adaptive_threshold', action=argparse.BooleanOptionalAction,
+                        default=None, help='adjust the threshold and exposure to keep the LED candidate count bounded')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    timer = StartupTimer(STARTUP_START)
+
+    args = vars(parseArgs(argv))
+    config_path = args.pop('config')
+    config = run_config.loadConfig(config_path, args)
+    timer.stage('config')
+
+    run(config, timer)
 
 
 if __name__ == '__main__':
     main()
-
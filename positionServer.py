@@ -0,0 +1,273 @@
+import json
+import select
+import socket
+import time
+
+# Distance in feet a robot must move for an on-change subscriber to be sent an update
+CHANGE_TOLERANCE = 0.01
+
+
+def configDataPacket(config):
+
+    data_dict = {
+        'FPS': config['save_frame_rate'],
+        'PACKET_SIZE': config['packet_size']
+    }
+
+    data = json.dumps(data_dict)
+
+    return data
+
+
+class ClientSession:
+    """
+    A connected client and its subscription.
+    Until a client subscribes, it is sent every robot on every frame, as clients were before subscriptions existed.
+    """
+
+    def __init__(self, conn, address):
+        self.conn = conn
+        self.address = address
+
+        # Subscription: the robot IDs to send (None for all), the maximum rate in Hz (None for no limit),
+        # and whether to send only when a subscribed robot has moved
+        self.bots = None
+        self.max_rate = None
+        self.on_change = False
+
+        # A client replies to each packet before it is sent another, so updates are coalesced while it is busy
+        self.awaiting_reply = False
+        self.last_sent_time = -float('inf')
+        self.last_positions = None
+
+    def subscribe(self, subscription):
+        """
+        Apply a subscription message sent by the client, such as
+        {"SUBSCRIBE": {"bots": ["X", "CAM"], "max_rate": 2, "on_change": true}}
+        :param subscription:    The value of the message's SUBSCRIBE field
+        """
+        bots = subscription.get('bots')
+        self.bots = None if bots is None else tuple(sorted(str(bot).upper() for bot in bots))
+
+        max_rate = subscription.get('max_rate')
+        self.max_rate = None if max_rate is None or max_rate <= 0 else float(max_rate)
+
+        self.on_change = bool(subscription.get('on_change', False))
+
+        # Send the new selection straight away
+        self.last_positions = None
+        self.last_sent_time = -float('inf')
+
+        print('Client ' + str(self.address) + ' subscribed to ' + json.dumps(subscription))
+
+    def wantsUpdate(self, positions, now):
+        """
+        Decide whether the client should be sent the given positions now.
+        :param positions:       The positions of the client's subscribed robots
+        :param now:             The current time.monotonic() time
+        :return:                True if the positions should be sent
+        """
+
+        if self.awaiting_reply:
+            return False
+
+        if self.max_rate is not None and now - self.last_sent_time < 1 / self.max_rate:
+            return False
+
+        if self.on_change and self.last_positions is not None and not positionsChanged(self.last_positions,
+                                                                                       positions):
+            return False
+
+        return True
+
+
+def positionsChanged(old_positions, new_positions):
+    """
+    Check whether any robot has appeared, disappeared, or moved further than CHANGE_TOLERANCE.
+    """
+    if old_positions.keys() != new_positions.keys():
+        return True
+
+    for bot, new_position in new_positions.items():
+        old_position = old_positions[bot]
+        if old_position is None or new_position is None:
+            if old_position is not new_position:
+                return True
+            continue
+
+        if abs(new_position[0] - old_position[0]) > CHANGE_TOLERANCE or \
+                abs(new_position[1] - old_position[1]) > CHANGE_TOLERANCE:
+            return True
+
+    return False
+
+
+class PositionServer:
+    """
+    TCP server that publishes robot positions to any number of clients.
+    After receiving the config packet, a client may send a subscription message naming the robots it wants,
+    the maximum rate at which it wants them, and whether it only wants them when they change. Updates are
+    filtered and coalesced per client, and each distinct selection of robots is serialized once per frame.
+    """
+
+    def __init__(self, config):
+        """
+        Open the TCP socket so clients can start connecting while the camera is being configured.
+        :param config:          The config dict
+        """
+        print('Starting server...')
+
+        self.config = config
+        self.sessions = []
+
+        # Serialization and send times of the last published frame, which are published with the next frame
+        self.previous_publish = None
+
+        host = socket.gethostname()
+        port = config['port']
+
+        # Open the TCP socket at the given port
+        self.server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.server_socket.bind(('', port))
+        self.server_socket.listen(5)
+        print('Listening for TCP session requests at ' + host + ':' + str(port))
+
+    def acceptClient(self):
+        conn, address = self.server_socket.accept()
+        print('Accepting TCP session from ' + str(address))
+
+        conn.send(configDataPacket(self.config).encode())
+
+        self.sessions.append(ClientSession(conn, address))
+
+    def waitForClient(self):
+        """
+        Block until a client connects.
+        """
+        self.acceptClient()
+
+    def dropClient(self, session):
+        print('Client ' + str(session.address) + ' closed. Continuing to listen...')
+        session.conn.close()
+        self.sessions.remove(session)
+
+    def poll(self):
+        """
+        Accept new clients and handle messages from connected clients without blocking.
+        """
+        readable, _, _ = select.select([self.server_socket] + [session.conn for session in self.sessions], [], [], 0)
+
+        for ready_socket in readable:
+            if ready_socket is self.server_socket:
+                self.acceptClient()
+                continue
+
+            session = next(session for session in self.sessions if session.conn is ready_socket)
+            try:
+                data = session.conn.recv(self.config['packet_size'])
+            except ConnectionError:
+                data = b''
+
+            if not data:
+                self.dropClient(session)
+                continue
+
+            # Any message, whether a reply or a subscription, means the client is ready for the next packet
+            session.awaiting_reply = False
+
+            subscription = parseSubscription(data)
+            if subscription is not None:
+                session.subscribe(subscription)
+
+    def publish(self, bot_positions, extras, trace=None):
+        """
+        Send each client the positions it is subscribed to, if it wants an update now.
+        :param bot_positions:   A dict of the position of each robot, including the camera as 'CAM'
+        :param extras:          A dict of fields sent to every client with every update, such as controller metrics
+        :param trace:           The FrameTrace of the frame, or None to not publish a trace
+        """
+
+        self.poll()
+
+        if len(self.sessions) < 1:
+            return
+
+        if trace is not None:
+            trace.skip()
+
+        now = time.monotonic()
+        payloads = {}
+        serialization_time = 0
+        send_time = 0
+
+        for session in list(self.sessions):
+            if session.bots is None:
+                positions = bot_positions
+            else:
+                positions = {bot: bot_positions.get(bot) for bot in session.bots}
+
+            if not session.wantsUpdate(positions, now):
+                continue
+
+            # Clients with the same selection of robots share one serialized packet
+            if session.bots not in payloads:
+                start = time.monotonic()
+                packet = dict(positions)
+                packet.update(extras)
+                if trace is not None:
+                    packet['TRACE'] = trace.toPacket(self.previous_publish)
+                payloads[session.bots] = json.dumps(packet).encode()
+                serialization_time += time.monotonic() - start
+
+            start = time.monotonic()
+            try:
+                session.conn.send(payloads[session.bots])
+            except (BrokenPipeError, ConnectionError):
+                self.dropClient(session)
+                continue
+            send_time += time.monotonic() - start
+
+            session.awaiting_reply = True
+            session.last_sent_time = now
+            session.last_positions = positions
+
+        if trace is not None and len(payloads) > 0:
+            trace.spans['serialization'] = serialization_time
+            trace.spans['send'] = send_time
+            self.previous_publish = {'serialization': serialization_time, 'send': send_time}
+
+    def close(self):
+        for session in self.sessions:
+            session.conn.close()
+        self.sessions = []
+
+        self.server_socket.close()
+        print('TCP socket closed...')
+
+
+def parseSubscription(data):
+    """
+    Get the subscription from a message sent by a client.
+    :param data:            The bytes received from the client
+    :return:                The value of the message's SUBSCRIBE field, or None if the message is not a subscription
+    """
+    try:
+        text = data.decode()
+    except UnicodeDecodeError:
+        return None
+
+    # A reply to the previous packet may arrive in the same read as the subscription
+    start = text.find('{')
+    if start < 0:
+        return None
+
+    try:
+        message, _ = json.JSONDecoder().raw_decode(text[start:])
+    except ValueError:
+        return None
+
+    if isinstance(message, dict) and isinstance(message.get('SUBSCRIBE'), dict):
+        return message['SUBSCRIBE']
+
+    return None
@@ -0,0 +1,112 @@
+import math
+import random
+
+import pytest
+
+import botDetector
+import botPatterns
+
+# Distance in feet between adjacent LEDs used to lay out test groups
+LED_SPACING = 0.25
+
+# Number of noisy groups placed per pattern
+TRIALS = 1000
+
+
+def placePattern(name, rng, noise=0.0, doubled_led=False):
+    """
+    Lay out a pattern's LEDs in field coordinates at a random rotation, with Gaussian noise on each LED.
+    :param name:            The name of the pattern
+    :param rng:             The random.Random to draw the rotation and noise from
+    :param noise:           The standard deviation of the noise as a fraction of the LED spacing
+    :param doubled_led:     If True, add a second point next to one LED, as when both of its contours are kept
+    :return:                The group of LED positions
+    """
+    pattern = botPatterns.getPattern(name)
+    angle = rng.uniform(0, 2 * math.pi)
+
+    group = []
+    for row_idx, row in enumerate(pattern):
+        for col_idx, state in enumerate(row):
+            if state < 1:
+                continue
+
+            x = (col_idx - 1) * LED_SPACING
+            y = (1 - row_idx) * LED_SPACING
+            group.append((10 + x * math.cos(angle) - y * math.sin(angle) + rng.gauss(0, noise * LED_SPACING),
+                          5 + x * math.sin(angle) + y * math.cos(angle) + rng.gauss(0, noise * LED_SPACING)))
+
+    if doubled_led:
+        led = rng.choice(group)
+        group.append((led[0] + 0.015, led[1]))
+
+    return group
+
+
+def rejections(name, rng, noise, doubled_led, led_spacing=None):
+    profile = botDetector.patternProfile(botPatterns.getPattern(name))
+    return sum(botDetector.rejectShape(placePattern(name, rng, noise, doubled_led), profile, led_spacing) is not None
+               for _ in range(TRIALS))
+
+
+@pytest.mark.parametrize('name', sorted(botPatterns.patterns))
+@pytest.mark.parametrize('noise', [0.0, 0.07, 0.13])
+def test_true_groups_pass_checks(name, noise):
+    # 13% of the LED spacing is about a pixel of centroid truncation on the far side of the field
+    assert rejections(name, random.Random(name + str(noise)), noise, doubled_led=False) == 0
+
+
+@pytest.mark.parametrize('name', sorted(botPatterns.patterns))
+def test_true_groups_with_doubled_led_pass_checks(name):
+    assert rejections(name, random.Random(name), 0.13, doubled_led=True) <= TRIALS * 0.005
+
+
+@pytest.mark.parametrize('name', sorted(botPatterns.patterns))
+def test_true_groups_pass_size_check(name):
+    assert rejections(name, random.Random(name), 0.07, doubled_led=True, led_spacing=LED_SPACING) == 0
+
+
+def test_count_check():
+    profile = botDetector.patternProfile(botPatterns.getPattern('X'))
+    group = placePattern('X', random.Random(0))
+
+    assert botDetector.rejectShape(group[:-1], profile) == 'count'
+    assert botDetector.rejectShape(group * 2, profile) != 'count'
+    assert botDetector.rejectShape(group * 2 + group[:1], profile) == 'count'
+
+
+def test_size_check():
+    profile = botDetector.patternProfile(botPatterns.getPattern('H'))
+    group = placePattern('H', random.Random(0))
+
+    assert botDetector.rejectShape(group, profile, LED_SPACING * 2) == 'size'
+    assert botDetector.rejectShape(group, profile, LED_SPACING / 2) == 'size'
+
+
+def test_center_check():
+    # An X has an LED at its center, which an L of the same size doesn't
+    group = placePattern('X', random.Random(0))
+
+    assert botDetector.rejectShape(group, botDetector.patternProfile(botPatterns.getPattern('L'))) == 'center'
+
+
+def test_measurements_are_shared():
+    group = placePattern('STAIR', random.Random(0))
+    measurements = {}
+
+    for name in botPatterns.patterns:
+        botDetector.detectShape(group, botPatterns.getPattern(name), measurements=measurements)
+
+    assert measurements == botDetector.measureGroup(group, {})
+
+
+@pytest.mark.parametrize('name', sorted(botPatterns.patterns))
+def test_best_match_finds_each_robot(name):
+    rng = random.Random(name)
+    groups = [placePattern(other, rng, 0.07) for other in botPatterns.patterns]
+    for group_idx, group in enumerate(groups):
+        groups[group_idx] = [(x + 3 * group_idx, y) for x, y in group]
+
+    best_group, score = botDetector.bestMatches(groups, [name])[name]
+    assert score < math.inf
+    assert best_group is not None
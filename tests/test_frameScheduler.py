@@ -0,0 +1,103 @@
+import time
+
+import numpy
+
+import frameScheduler
+import frameSources
+import tracing
+
+
+def finishFrame(scheduler, elapsed, index=0):
+    """
+    End a frame that took the given number of seconds from capture to publication.
+    """
+    trace = tracing.FrameTrace(index, time.monotonic() - elapsed)
+    trace.span('capture')
+    scheduler.endFrame(trace)
+
+
+def test_degrades_when_over_deadline():
+    scheduler = frameScheduler.FrameScheduler(0.1, settle_frames=3)
+
+    # Nothing changes while the scheduler settles
+    for _ in range(3):
+        finishFrame(scheduler, 0.2)
+    assert scheduler.level == frameScheduler.FULL_QUALITY
+
+    finishFrame(scheduler, 0.2)
+    assert scheduler.level == frameScheduler.DOWNSCALE
+    assert scheduler.missed_deadlines == 4
+
+
+def test_degrades_one_level_per_settle_period():
+    scheduler = frameScheduler.FrameScheduler(0.1, settle_frames=2)
+
+    for _ in range(30):
+        finishFrame(scheduler, 0.2)
+    assert scheduler.level == frameScheduler.SKIP_FRAMES
+
+    metrics = scheduler.metrics()
+    assert metrics['name'] == 'skip_frames'
+    assert metrics['missed_deadlines'] == 30
+    assert metrics['deadline'] == 100
+
+
+def test_restores_after_headroom():
+    scheduler = frameScheduler.FrameScheduler(0.1, restore_frames=5, settle_frames=0)
+    scheduler.setLevel(frameScheduler.LIMIT_GROUPS)
+    scheduler.average_time = 0.01
+
+    for _ in range(4):
+        finishFrame(scheduler, 0.01)
+    assert scheduler.level == frameScheduler.LIMIT_GROUPS
+
+    finishFrame(scheduler, 0.01)
+    assert scheduler.level == frameScheduler.TRACK_CONFIDENT
+
+
+def test_holds_level_between_thresholds():
+    scheduler = frameScheduler.FrameScheduler(0.1, restore_frames=5, settle_frames=0)
+    scheduler.setLevel(frameScheduler.DOWNSCALE)
+    scheduler.average_time = 0.075
+
+    # Between restore_at and degrade_at of the deadline, so neither too slow nor fast enough to restore
+    for _ in range(20):
+        finishFrame(scheduler, 0.075)
+    assert scheduler.level == frameScheduler.DOWNSCALE
+    assert scheduler.frames_with_headroom == 0
+
+
+def test_single_missed_deadline_degrades():
+    scheduler = frameScheduler.FrameScheduler(0.1, settle_frames=0)
+    finishFrame(scheduler, 0.01)
+
+    finishFrame(scheduler, 0.15)
+    assert scheduler.level == frameScheduler.DOWNSCALE
+
+
+def test_skips_frames_only_at_lowest_level():
+    scheduler = frameScheduler.FrameScheduler(0.1)
+    frames = [frameSources.Frame(index, 0, numpy.zeros((2, 2), numpy.uint8)) for index in range(6)]
+
+    assert all(scheduler.shouldProcess(frame) for frame in frames)
+
+    scheduler.setLevel(frameScheduler.SKIP_FRAMES)
+    assert [scheduler.shouldProcess(frame) for frame in frames] == [True, False] * 3
+    assert scheduler.skipped_frames == 3
+
+
+def test_dropped_frames_are_not_converted(monkeypatch):
+    conversions = []
+    grayFromBGR = frameSources.grayFromBGR
+    monkeypatch.setattr(frameSources, 'grayFromBGR', lambda *args: conversions.append(args) or grayFromBGR(*args))
+
+    frame = frameSources.bgrFrame(1, 0, numpy.zeros((40, 60, 3), numpy.uint8), time.monotonic(), (30, 20))
+    scheduler = frameScheduler.FrameScheduler(0.1)
+    scheduler.setLevel(frameScheduler.SKIP_FRAMES)
+
+    assert not scheduler.shouldProcess(frame)
+    assert frame.detection_scale == (2, 2)
+    assert len(conversions) == 0
+
+    assert frame.gray.shape == (20, 30)
+    assert len(conversions) == 1
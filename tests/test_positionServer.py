@@ -0,0 +1,67 @@
+import positionServer
+
+
+def test_parse_subscription():
+    data = b'{"SUBSCRIBE": {"bots": ["X", "CAM"], "max_rate": 2, "on_change": true}}'
+
+    assert positionServer.parseSubscription(data) == {'bots': ['X', 'CAM'], 'max_rate': 2, 'on_change': True}
+
+
+def test_parse_subscription_after_reply():
+    # A reply to the previous packet may arrive in the same read as the subscription
+    data = b'ok{"SUBSCRIBE": {"bots": ["Y"]}}'
+
+    assert positionServer.parseSubscription(data) == {'bots': ['Y']}
+
+
+def test_parse_subscription_ignores_other_messages():
+    for data in [b'ok', b'', b'{"SUBSCRIBE": ', b'{"SUBSCRIBE": ["X"]}', b'{"OTHER": {}}', b'[1, 2]',
+                 b'\xff\xfe{"SUBSCRIBE": {}}']:
+        assert positionServer.parseSubscription(data) is None
+
+
+def test_positions_unchanged():
+    old = {'X': (1.0, 2.0), 'Y': None}
+
+    assert not positionServer.positionsChanged(old, {'X': (1.0, 2.0), 'Y': None})
+    assert not positionServer.positionsChanged(old, {'X': (1.005, 1.995), 'Y': None})
+
+
+def test_positions_changed():
+    old = {'X': (1.0, 2.0), 'Y': None}
+
+    # Moved
+    assert positionServer.positionsChanged(old, {'X': (1.02, 2.0), 'Y': None})
+    assert positionServer.positionsChanged(old, {'X': (1.0, 1.98), 'Y': None})
+
+    # Appeared or disappeared
+    assert positionServer.positionsChanged(old, {'X': (1.0, 2.0), 'Y': (0.0, 0.0)})
+    assert positionServer.positionsChanged(old, {'X': None, 'Y': None})
+
+    # Different selection of robots
+    assert positionServer.positionsChanged(old, {'X': (1.0, 2.0)})
+
+
+def test_session_wants_update():
+    session = positionServer.ClientSession(None, ('localhost', 0))
+    session.subscribe({'bots': ['x', 'CAM'], 'max_rate': 2, 'on_change': True})
+    positions = {'CAM': (0.0, 0.0), 'X': (1.0, 2.0)}
+
+    assert session.bots == ('CAM', 'X')
+    assert session.wantsUpdate(positions, 0)
+
+    session.last_sent_time = 0
+    session.last_positions = positions
+
+    # Waiting for the client's reply
+    session.awaiting_reply = True
+    assert not session.wantsUpdate({'CAM': (0.0, 0.0), 'X': (3.0, 2.0)}, 1)
+    session.awaiting_reply = False
+
+    # Over the maximum rate
+    assert not session.wantsUpdate({'CAM': (0.0, 0.0), 'X': (3.0, 2.0)}, 0.25)
+
+    # Unchanged
+    assert not session.wantsUpdate(positions, 1)
+
+    assert session.wantsUpdate({'CAM': (0.0, 0.0), 'X': (3.0, 2.0)}, 1)
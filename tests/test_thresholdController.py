@@ -0,0 +1,104 @@
+import pytest
+
+import thresholdController
+
+
+class ExposureSource:
+    """
+    A stand-in for a FrameSource with an adjustable exposure, which records each adjustment it is asked for.
+    """
+
+    supports_exposure = True
+
+    def __init__(self, exposure=100, max_exposure=100):
+        self.exposure = exposure
+        self.max_exposure = max_exposure
+        self.factors = []
+
+    def adjustExposure(self, factor):
+        self.factors.append(factor)
+        new_exposure = min(self.max_exposure, self.exposure * factor)
+        if new_exposure == self.exposure:
+            return False
+
+        self.exposure = new_exposure
+        return True
+
+
+def test_expected_led_count():
+    assert thresholdController.expectedLEDCount(['x', 'Y', 'H']) == 5 + 4 + 7
+
+
+def test_count_in_band_keeps_threshold():
+    controller = thresholdController.ThresholdController(10, threshold=200)
+
+    assert (controller.target_low, controller.target_high) == (8, 20)
+    for count in [8, 12, 20]:
+        assert controller.update(count) == 200
+    assert controller.threshold_adjustments == 0
+
+
+def test_too_many_candidates_raises_threshold():
+    controller = thresholdController.ThresholdController(10, threshold=200)
+
+    assert controller.update(40) == 204
+    assert controller.update(25) > 204
+    assert controller.threshold_adjustments == 2
+
+
+def test_too_few_candidates_lowers_threshold():
+    controller = thresholdController.ThresholdController(10, threshold=200)
+
+    assert controller.update(4) == 196
+    assert controller.update(0) < 196
+
+
+def test_step_is_limited():
+    controller = thresholdController.ThresholdController(10, threshold=200, max_step=6)
+
+    assert controller.update(100000) == 206
+    assert controller.update(0) == 200
+
+
+def test_threshold_is_clamped():
+    controller = thresholdController.ThresholdController(10, threshold=252, max_threshold=254)
+
+    assert controller.update(1000) == 254
+    assert controller.update(1000) == 254
+    assert controller.threshold_adjustments == 1
+
+
+def test_exposure_adjusted_at_threshold_limit():
+    source = ExposureSource()
+    controller = thresholdController.ThresholdController(10, threshold=254, source=source)
+
+    assert controller.update(1000) == 254
+    assert source.factors == [controller.EXPOSURE_STEP]
+    assert controller.exposure_adjustments == 1
+
+    # The exposure is left alone while the camera applies it
+    for _ in range(controller.EXPOSURE_SETTLE_FRAMES):
+        controller.update(1000)
+    assert len(source.factors) == 1
+
+    controller.update(1000)
+    assert len(source.factors) == 2
+    assert controller.metrics()['exposure'] == pytest.approx(100 * controller.EXPOSURE_STEP ** 2)
+
+
+def test_exposure_capped():
+    source = ExposureSource()
+    controller = thresholdController.ThresholdController(10, threshold=150, source=source)
+
+    # The exposure is already at its cap, so there is nothing to settle
+    controller.update(0)
+    controller.update(0)
+    assert source.factors == [1 / controller.EXPOSURE_STEP] * 2
+    assert controller.exposure_adjustments == 0
+
+
+def test_no_source_only_adjusts_threshold():
+    controller = thresholdController.ThresholdController(10, threshold=150)
+
+    assert controller.update(0) == 150
+    assert 'exposure' not in controller.metrics()
@@ -0,0 +1,113 @@
+import math
+
+import botDetector
+import botPatterns
+
+
+def expectedLEDCount(bot_names):
+    """
+    Count the LEDs that should be visible when every robot in play is on the field.
+    :param bot_names:       The names of the patterns of the robots in play
+    :return:                The total number of LEDs in their patterns
+    """
+    return sum(botDetector.numPointsInPattern(botPatterns.patterns[name.upper()]) for name in bot_names)
+
+
+class ThresholdController:
+    """
+    Closed-loop control of the LED brightness threshold, and of the camera exposure where the frame source supports
+    it, that keeps the number of LED candidates found in each frame within a band around the expected LED count.
+    Bounding the candidate count bounds the cost of grouping and matching, which grows quadratically with it.
+    """
+
+    # Number of frames to wait after changing the exposure before judging its effect, since cameras apply new
+    # exposure settings a few frames late
+    EXPOSURE_SETTLE_FRAMES = 5
+
+    # Exposure is scaled by this factor, or its inverse, for each adjustment
+    EXPOSURE_STEP = 0.8
+
+    def __init__(self, expected_count, threshold=230, min_threshold=150, max_threshold=254, band=(0.8, 2.0),
+                 max_step=16, source=None):
+        """
+        :param expected_count:  The number of LEDs expected in each frame
+        :param threshold:       The starting brightness threshold
+        :param min_threshold:   The lowest threshold the controller will use
+        :param max_threshold:   The highest threshold the controller will use
+        :param band:            The (low, high) candidate counts to aim for, as multiples of the expected count
+        :param max_step:        The largest change to the threshold in a single frame
+        :param source:          The FrameSource whose exposure can be adjusted, or None to only adjust the threshold
+        """
+        self.expected_count = expected_count
+        self.threshold = threshold
+        self.min_threshold = min_threshold
+        self.max_threshold = max_threshold
+        self.max_step = max_step
+        self.source = source
+
+        self.target_low = max(1, int(expected_count * band[0]))
+        self.target_high = max(self.target_low, int(math.ceil(expected_count * band[1])))
+
+        self.candidates = 0
+        self.threshold_adjustments = 0
+        self.exposure_adjustments = 0
+        self.settle_frames = 0
+
+    def update(self, candidate_count):
+        """
+        Adjust the threshold, and the exposure if needed, given the number of LED candidates found in a frame.
+        :param candidate_count: The number of bright blobs found with the current threshold
+        :return:                The threshold to use for the next frame
+        """
+        self.candidates = candidate_count
+
+        if self.settle_frames > 0:
+            self.settle_frames -= 1
+            return self.threshold
+
+        if candidate_count > self.target_high:
+            direction = 1
+        elif candidate_count < self.target_low:
+            direction = -1
+        else:
+            return self.threshold
+
+        # Step further the further the count is outside the band, doubling the step for each doubling of the error
+        target = self.target_high if direction > 0 else self.target_low
+        ratio = max(candidate_count, 1) / target
+        step = min(self.max_step, max(1, int(abs(math.log2(ratio)) * 4)))
+
+        new_threshold = min(self.max_threshold, max(self.min_threshold, self.threshold + direction * step))
+
+        if new_threshold != self.threshold:
+            self.threshold = new_threshold
+            self.threshold_adjustments += 1
+
+        # The threshold is at its limit, so change how much light reaches the sensor instead
+        elif self.source is not None and self.source.supports_exposure:
+            factor = self.EXPOSURE_STEP if direction > 0 else 1 / self.EXPOSURE_STEP
+            if self.source.adjustExposure(factor):
+                self.exposure_adjustments += 1
+                self.settle_frames = self.EXPOSURE_SETTLE_FRAMES
+
+        return self.threshold
+
+    def metrics(self):
+        """
+        Get the state of the controller.
+        :return:                A dict of the controller's state
+        """
+        metrics = {
+            'threshold': self.threshold,
+            'candidates': self.candidates,
+            'expected': self.expected_count,
+            'target_low': self.target_low,
+            'target_high': self.target_high,
+            'threshold_adjustments': self.threshold_adjustments,
+            'exposure_adjustments': self.exposure_adjustments
+        }
+
+        if self.source is not None and self.source.supports_exposure:
+            metrics['exposure'] = self.source.exposure
+
+        return metrics
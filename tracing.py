@@ -0,0 +1,56 @@
+import time
+
+
+class FrameTrace:
+    """
+    Timing of each processing stage of a frame, measured on the monotonic clock from the frame's capture time.
+    The monotonic clock is shared by all processes on a host, so a client on the same host can compare its own
+    receipt time with the capture time to get the full latency from capture to receipt.
+    """
+
+    def __init__(self, frame_id, capture_time):
+        """
+        :param frame_id:        The sequence number of the frame
+        :param capture_time:    The time.monotonic() time at which the frame was captured
+        """
+        self.frame_id = frame_id
+        self.capture_time = capture_time
+        self.spans = {}
+        self.mark = capture_time
+
+    def span(self, name):
+        """
+        End the current stage, naming it. Each stage starts where the previous one ended,
+        and the first stage starts at the capture time.
+        :param name:            The name of the stage that just ended
+        """
+        now = time.monotonic()
+        self.spans[name] = self.spans.get(name, 0) + now - self.mark
+        self.mark = now
+
+    def skip(self):
+        """
+        Restart timing without counting the time since the last stage towards any stage.
+        """
+        self.mark = time.monotonic()
+
+    def toPacket(self, previous_publish=None):
+        """
+        Get the trace as a dict to publish with the frame's results.
+        The time it takes to serialize and send the packet can't be carried in the packet itself, so the
+        serialization and send spans of the previous frame are carried instead.
+        :param previous_publish:    A dict of the serialization and send spans of the previous frame, or None
+        :return:                    The trace as a dict, with times in milliseconds except for the capture time
+        """
+        packet = {
+            'frame': self.frame_id,
+            'capture': self.capture_time,
+            'publish': time.monotonic(),
+            'spans': {name: round(duration * 1000, 3) for name, duration in self.spans.items()}
+        }
+
+        if previous_publish is not None:
+            packet['previous_publish'] = {name: round(duration * 1000, 3)
+                                          for name, duration in previous_publish.items()}
+
+        return packet